@@ -0,0 +1,33 @@
+"""add sample_id, created_at index to image_scores
+
+Revision ID: 693a1bef291c
+Revises: 60f03386992c
+Create Date: 2026-10-15 10:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '693a1bef291c'
+down_revision: Union[str, Sequence[str], None] = '60f03386992c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_image_scores_sample_created',
+        'image_scores',
+        ['sample_id', sa.text('created_at DESC')],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_image_scores_sample_created', table_name='image_scores')
@@ -0,0 +1,28 @@
+"""add thumbnail_url to image_scores
+
+Revision ID: a41c7e9d2b10
+Revises: 693a1bef291c
+Create Date: 2026-10-15 14:03:27.520917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41c7e9d2b10'
+down_revision: Union[str, Sequence[str], None] = '693a1bef291c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('image_scores', sa.Column('thumbnail_url', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('image_scores', 'thumbnail_url')
@@ -0,0 +1,117 @@
+# backend/app/batching.py
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import List, Optional
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+MAX_BATCH_SIZE = 16      # Upper bound on samples fused into one forward pass
+BATCH_TIMEOUT = 0.008    # Seconds to wait for more samples after the first one arrives
+
+
+class Batcher:
+    """
+    Dynamic request batcher around a PyTorch model, driven by the event loop.
+    Requests `await submit(tensor)` with one preprocessed [C, H, W] sample.
+    A background task takes the first queued sample, waits up to `timeout`
+    for more (or until `max_batch_size` is reached), stacks them, runs the
+    model once and resolves each request's future with its own output row.
+
+    The forward pass runs on a single dedicated thread, so the loop stays
+    free while it computes and only one batch uses the intra-op threads at a time.
+    """
+
+    def __init__(self, model: nn.Module, max_batch_size: int = MAX_BATCH_SIZE, timeout: float = BATCH_TIMEOUT):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-batcher")
+
+    def start(self):
+        """Starts the batching task on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self):
+        """Cancels the batching task and fails any requests still queued."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def eval(self):
+        self.model.eval()
+        return self
+
+    async def submit(self, sample: torch.Tensor) -> torch.Tensor:
+        """Queues a single [C, H, W] sample and waits for its output row."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sample, future))
+        return await future
+
+    async def submit_many(self, samples: List[torch.Tensor]) -> torch.Tensor:
+        """Queues several samples in one go and returns their output rows stacked."""
+        rows = await asyncio.gather(*(self.submit(sample) for sample in samples))
+        return torch.stack(rows)
+
+    async def _collect(self, first):
+        """Gathers up to max_batch_size items, waiting at most `timeout` after the first."""
+        loop = asyncio.get_running_loop()
+        items = [first]
+        deadline = loop.time() + self.timeout
+        while len(items) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    def _forward(self, samples: List[torch.Tensor]) -> torch.Tensor:
+        # Stacking HWC views writes the batch straight into NHWC (channels_last)
+        # order: one copy instead of stack + contiguous()
+        batch = torch.stack([sample.permute(1, 2, 0) for sample in samples]).permute(0, 3, 1, 2)
+        with torch.inference_mode():
+            return self.model(batch)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect(await self._queue.get())
+            samples = [sample for sample, _ in items]
+            futures = [future for _, future in items]
+
+            try:
+                outputs = await loop.run_in_executor(self._executor, self._forward, samples)
+            except Exception as e:
+                logger.error(f"Batched inference failed for {len(items)} samples: {e}", exc_info=True)
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Split outputs back per request (a caller may have disconnected meanwhile)
+            for future, output in zip(futures, outputs):
+                if not future.done():
+                    future.set_result(output)
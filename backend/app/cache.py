@@ -0,0 +1,59 @@
+# backend/app/cache.py
+
+import os
+import json
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Optional Redis cache for upload results. Unset = every lookup goes to the database.
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_TTL = 3600  # Seconds a cached score stays valid
+
+
+def score_key(filename: str) -> str:
+    return f"score:{filename}"
+
+
+def connect():
+    """Returns an asyncio Redis client for REDIS_URL, or None when caching is disabled."""
+    if not REDIS_URL:
+        return None
+    import redis.asyncio as redis
+    return redis.from_url(REDIS_URL)
+
+
+async def get_score(redis, filename: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cached upload result for `filename`, or None on a miss.
+    Redis errors count as a miss so the database stays the source of truth.
+    """
+    if redis is None:
+        return None
+    try:
+        cached = await redis.get(score_key(filename))
+    except Exception as e:
+        logger.warning(f"Redis GET failed for {filename}: {e}")
+        return None
+    return json.loads(cached) if cached else None
+
+
+async def set_score(redis, result: Dict[str, Any]):
+    """Caches an upload result, thumbnail included."""
+    if redis is None:
+        return
+    try:
+        await redis.set(score_key(result["filename"]), json.dumps(result), ex=CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Redis SET failed for {result['filename']}: {e}")
+
+
+async def delete_score(redis, filename: str):
+    """Drops a cached result after its scores are edited."""
+    if redis is None:
+        return
+    try:
+        await redis.delete(score_key(filename))
+    except Exception as e:
+        logger.warning(f"Redis DELETE failed for {filename}: {e}")
@@ -0,0 +1,94 @@
+# backend/app/crud.py
+
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import ImageScore
+
+# Rows per INSERT/COPY round trip when saving a batch
+BULK_CHUNK_SIZE = 1000
+
+# Columns written for a new AI prediction (id and timestamps come from the DB)
+SCORE_COLUMNS = (
+    "filename",
+    "serial_number",
+    "sample_id",
+    "score_architecture",
+    "score_atrophy",
+    "score_complexes",
+    "score_fibrosis",
+    "score_total",
+    "thumbnail_url",
+)
+
+
+def score_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Maps an extract_and_process_image() result onto ImageScore columns."""
+    return {
+        "filename": result["filename"],
+        "serial_number": result["serial_number"],
+        "sample_id": result["sample_id"],
+        "score_architecture": result["scores"]["Pancreatic Architecture"],
+        "score_atrophy": result["scores"]["Glandular Atrophy"],
+        "score_complexes": result["scores"]["Pseudotubular Complexes"],
+        "score_fibrosis": result["scores"]["Fibrosis"],
+        "score_total": result["scores"]["Total"],
+        "thumbnail_url": result["display_url"]
+    }
+
+
+def chunked(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Splits rows into lists of at most `size` items."""
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+async def copy_scores(db: AsyncSession, rows: List[Dict[str, Any]]):
+    """
+    Postgres fast path: streams rows with COPY into a temp staging table,
+    then moves them into image_scores in one INSERT ... ON CONFLICT DO NOTHING
+    (COPY itself cannot skip duplicate filenames).
+    """
+    columns = ", ".join(SCORE_COLUMNS)
+    records = [tuple(row[column] for column in SCORE_COLUMNS) for row in rows]
+
+    await db.execute(text(
+        "CREATE TEMP TABLE image_scores_stage (LIKE image_scores INCLUDING DEFAULTS) ON COMMIT DROP"
+    ))
+    # asyncpg speaks the binary COPY protocol directly on the pooled connection
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "image_scores_stage", records=records, columns=list(SCORE_COLUMNS)
+    )
+    await db.execute(text(
+        f"INSERT INTO image_scores ({columns}) "
+        f"SELECT {columns} FROM image_scores_stage "
+        f"ON CONFLICT (filename) DO NOTHING"
+    ))
+    await db.commit()
+
+
+async def bulk_save_scores(db: AsyncSession, rows: List[Dict[str, Any]]):
+    """
+    Saves many new score rows at once.
+    Postgres uses COPY; other databases use one executemany INSERT per chunk.
+    Filenames that already exist are skipped, like the single-upload upsert.
+    """
+    if not rows:
+        return
+
+    if db.get_bind().dialect.name == "postgresql":
+        for chunk in chunked(rows, BULK_CHUNK_SIZE):
+            await copy_scores(db, chunk)
+        return
+
+    stmt = insert(ImageScore).on_conflict_do_nothing(index_elements=['filename'])
+    for chunk in chunked(rows, BULK_CHUNK_SIZE):
+        await db.execute(stmt, chunk)
+        await db.commit()
@@ -1,8 +1,7 @@
 # backend/app/database.py
 
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
 
 # 1. Get the Database URL from environment variables (.env)
@@ -14,27 +13,49 @@ SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
 if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# 3. Create the Engine with correct settings
-if "sqlite" in SQLALCHEMY_DATABASE_URL:
-    # SQLite Specific: "check_same_thread" is needed for multithreaded apps like FastAPI
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-    )
+# 3. Async Drivers
+# The API talks to the database without blocking the event loop, so the URL is
+# switched to the asyncio drivers (asyncpg for Postgres, aiosqlite for SQLite).
+def to_async_url(url: str) -> str:
+    """Rewrites a plain sync database URL to use the matching asyncio driver."""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+ASYNC_DATABASE_URL = to_async_url(SQLALCHEMY_DATABASE_URL)
+
+# 4. Create the Engine with correct settings
+if "sqlite" in ASYNC_DATABASE_URL:
+    engine = create_async_engine(ASYNC_DATABASE_URL)
 else:
     # Postgres/Supabase Specific: "pool_pre_ping" prevents the database connection
     # from "going stale" and crashing the app after a few hours of inactivity.
-    engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+    # The pool is per server process: with WEB_CONCURRENCY workers the database sees
+    # up to WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections, so keep
+    # these small and raise them only within the database's connection limit.
+    # Connections are recycled before Supabase's pooler drops them.
+    # Async engines use AsyncAdaptedQueuePool.
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "5")),
+        pool_recycle=1800,
+        pool_timeout=30
+    )
 
-# 4. Create Session Class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 5. Create Session Class
+# expire_on_commit=False keeps loaded attributes readable after commit; with
+# AsyncSession an expired attribute would need an implicit (and illegal) lazy load.
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
-# 5. Create Base Class
+# 6. Create Base Class
 Base = declarative_base()
 
-# 6. Dependency Injection
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+# 7. Dependency Injection
+# One AsyncSession per request, closed when the response is done.
+async def get_db():
+    async with SessionLocal() as session:
+        yield session
@@ -0,0 +1,325 @@
+# backend/app/inference.py
+
+import os
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+import torch
+import torch.nn as nn
+import onnxruntime as ort
+from torch.ao.quantization import fuse_modules
+from torchvision.models.resnet import BasicBlock
+
+try:
+    import intel_extension_for_pytorch as ipex
+except ImportError:  # Optional: only useful on Intel CPUs
+    ipex = None
+
+from app.utils import get_model, extract_and_process_image, MAX_SCORES
+
+logger = logging.getLogger(__name__)
+
+# Shape of a single preprocessed input (see MODEL_TRANSFORMS)
+INPUT_SHAPE = (1, 3, 224, 224)
+
+# TorchScript's profiling executor specializes the graph over the first couple of calls
+WARMUP_RUNS = 2
+
+# ONNX Runtime providers in order of preference; only the installed ones are used
+ONNX_PROVIDERS = ('TensorrtExecutionProvider', 'CUDAExecutionProvider', 'CPUExecutionProvider')
+
+# Serving backend: "auto" (int8 > existing ONNX > TorchScript), "onnx" (export
+# the FP32 checkpoint at startup if needed), "torch" (always TorchScript) or
+# "compile" (torch.compile / Inductor, falling back to TorchScript)
+BACKENDS = ("auto", "onnx", "torch", "compile")
+
+
+def optimize_for_cpu(model: nn.Module) -> torch.jit.ScriptModule:
+    """
+    Converts an eager model into a frozen TorchScript graph for CPU serving.
+    Freezing folds BatchNorm into the convolutions and inlines the weights,
+    then optimize_for_inference lets oneDNN pick packed conv kernels.
+    With Intel Extension for PyTorch installed, ipex.optimize does the weight
+    prepacking instead (tuned for the host's AVX-512/AMX units).
+    """
+    model = model.eval().to(memory_format=torch.channels_last)
+    example = torch.randn(*INPUT_SHAPE).to(memory_format=torch.channels_last)
+
+    if ipex is not None:
+        model = ipex.optimize(model, dtype=torch.float32)
+
+    with torch.inference_mode():
+        scripted = torch.jit.trace(model, example)
+        scripted = torch.jit.freeze(scripted)
+        if ipex is None:
+            scripted = torch.jit.optimize_for_inference(scripted)
+    return scripted
+
+
+def fuse_conv_bn(model: nn.Module) -> nn.Module:
+    """
+    Folds every BatchNorm of the ResNet into the convolution before it (in place,
+    eval mode), so torch.compile and the eager fallback skip the separate BN pass.
+    TorchScript freezing does the same fold, so it only finds nothing left to do.
+    Only conv+bn pairs: a BasicBlock reuses its ReLU after the residual add.
+    """
+    groups = [["conv1", "bn1"]]
+    for name, module in model.named_modules():
+        if isinstance(module, BasicBlock):
+            groups.append([f"{name}.conv1", f"{name}.bn1"])
+            groups.append([f"{name}.conv2", f"{name}.bn2"])
+            if module.downsample is not None:
+                groups.append([f"{name}.downsample.0", f"{name}.downsample.1"])
+    return fuse_modules(model.eval(), groups, inplace=True)
+
+
+def compile_model(model: nn.Module) -> nn.Module:
+    """
+    Compiles the eager model with Inductor, which fuses the pointwise ops and
+    generates CPU kernels for them. dynamic=True gives one graph for every batch
+    size the Batcher produces instead of a recompile per size.
+    Compilation happens on the first call, so run warmup() right after.
+    """
+    # Lets the fc matmul use bf16/TF32 kernels where the CPU has them
+    torch.set_float32_matmul_precision("medium")
+    model = model.eval().to(memory_format=torch.channels_last)
+    return torch.compile(model, dynamic=True)
+
+
+class OnnxModel:
+    """
+    Runs an exported ONNX graph with ONNX Runtime.
+    Callable like the PyTorch model (tensor in, tensor out), so it can be
+    wrapped by Batcher and used by predict_scores unchanged.
+    """
+
+    def __init__(self, onnx_path: Path):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+
+        available = ort.get_available_providers()
+        self.session = ort.InferenceSession(
+            str(onnx_path),
+            sess_options=options,
+            providers=[p for p in ONNX_PROVIDERS if p in available]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        inputs = batch.detach().cpu().contiguous().numpy()
+        outputs = self.session.run(None, {self.input_name: inputs})[0]
+        return torch.from_numpy(outputs)
+
+
+def export_onnx(model: nn.Module, onnx_path: Path):
+    """Exports the eager model to ONNX with a dynamic batch dimension."""
+    model.eval()
+    example = torch.randn(*INPUT_SHAPE)
+    torch.onnx.export(
+        model,
+        example,
+        str(onnx_path),
+        input_names=['input'],
+        output_names=['output'],
+        opset_version=17,
+        dynamic_axes={'input': {0: 'B'}, 'output': {0: 'B'}},
+        dynamo=False,
+    )
+
+
+def is_current(derived_path: Path, model_path: Path) -> bool:
+    """
+    True if `derived_path` (an int8 or ONNX model built from the checkpoint) exists
+    and is at least as new as `model_path`, i.e. not left over from before a retrain.
+    Without the checkpoint the derived model is all there is, so it counts as current.
+    """
+    if not derived_path.exists():
+        return False
+    return not model_path.exists() or derived_path.stat().st_mtime >= model_path.stat().st_mtime
+
+
+def ensure_onnx(model_path: Path, onnx_path: Path) -> Path:
+    """
+    Exports the FP32 checkpoint to `onnx_path` unless an export at least as
+    new as the checkpoint is already on disk, so restarts skip the export.
+    """
+    if is_current(onnx_path, model_path):
+        return onnx_path
+
+    logger.info(f" Exporting {model_path} to ONNX at {onnx_path}")
+    # Write to a temp file first so concurrent workers never load a half-written graph
+    tmp_path = onnx_path.with_name(f"{onnx_path.name}.{os.getpid()}.tmp")
+    export_onnx(load_fp32_model(model_path), tmp_path)
+    os.replace(tmp_path, onnx_path)
+    return onnx_path
+
+
+def load_fp32_model(model_path: Path) -> nn.Module:
+    """Loads the trained FP32 weights into an eager model."""
+    # mmap=True backs the checkpoint tensors with the page cache instead of a private
+    # heap copy, and assign=True keeps those tensors rather than copying them into
+    # freshly allocated parameters, so loading never holds two copies of the weights.
+    # Only callers that use the weights as-is (the ONNX export) keep sharing those
+    # pages between processes: fuse_conv_bn and TorchScript freezing write new,
+    # private conv weights, so each serving worker ends up with its own copy.
+    # Building the architecture on the meta device skips allocating and randomly
+    # initializing ~45 MB of weights that the checkpoint replaces anyway.
+    with torch.device("meta"):
+        model = get_model()
+    model.load_state_dict(
+        torch.load(model_path, map_location=torch.device('cpu'), weights_only=False, mmap=True),
+        assign=True
+    )
+    model.eval()
+    return model
+
+
+def load_int8_model(int8_path: Path) -> torch.jit.ScriptModule:
+    """Loads the int8 TorchScript model produced by quantize_model.py."""
+    # Same engine preference as quantize_model.py: x86 (VNNI-aware), else FBGEMM
+    for engine in ('x86', 'fbgemm'):
+        if engine in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = engine
+            break
+
+    model = torch.jit.load(int8_path, map_location=torch.device('cpu'))
+    model.eval()
+    return model
+
+
+def warmup(model: nn.Module, runs: int = WARMUP_RUNS):
+    """
+    Runs dummy forward passes so the first real request doesn't pay for
+    oneDNN kernel selection, scratchpad allocation or TorchScript profiling.
+    """
+    example = torch.zeros(*INPUT_SHAPE).to(memory_format=torch.channels_last)
+    with torch.inference_mode():
+        for _ in range(runs):
+            model(example)
+
+
+def load_model(
+    model_path: Path,
+    int8_path: Optional[Path] = None,
+    onnx_path: Optional[Path] = None,
+    backend: str = "auto",
+    num_threads: Optional[int] = None
+) -> nn.Module:
+    """
+    Loads the serving model (see _load_backend) and warms it up.
+    `num_threads` caps intra-op threads (default: all cores) when several
+    server processes share the machine.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}'. Expected one of {BACKENDS}")
+
+    torch.set_num_threads(num_threads or os.cpu_count() or 1)
+    torch.set_flush_denormal(True)
+
+    model = _load_backend(model_path, int8_path, onnx_path, backend)
+    warmup(model)
+    return model
+
+
+def _load_backend(
+    model_path: Path,
+    int8_path: Optional[Path] = None,
+    onnx_path: Optional[Path] = None,
+    backend: str = "auto"
+) -> nn.Module:
+    """
+    Loads the serving model, in order of preference:
+    1. the int8 quantized model when `int8_path` exists and is not older than the checkpoint,
+    2. the ONNX Runtime session when `onnx_path` exists and is not older than the checkpoint,
+    3. the FP32 model from `model_path`, optimized for inference.
+    backend="onnx" exports `onnx_path` first if needed and skips the int8 model;
+    backend="torch" goes straight to 3; backend="compile" uses torch.compile
+    instead of TorchScript for 3.
+    """
+    if backend == "onnx" and onnx_path is not None:
+        try:
+            ensure_onnx(model_path, onnx_path)
+        except Exception as e:
+            logger.warning(f"ONNX export failed ({e}), falling back to PyTorch")
+
+    if backend == "auto" and int8_path is not None and int8_path.exists():
+        if not is_current(int8_path, model_path):
+            # Left over from before a retrain: its weights no longer match the checkpoint
+            logger.warning(f"Int8 model {int8_path} is older than {model_path}, ignoring it. Re-run quantize_model.py")
+        else:
+            try:
+                model = load_int8_model(int8_path)
+                logger.info(f" Using int8 quantized model from {int8_path}")
+                return model
+            except Exception as e:
+                logger.warning(f"Could not load int8 model ({e}), falling back to FP32")
+
+    if backend in ("auto", "onnx") and onnx_path is not None and onnx_path.exists():
+        if not is_current(onnx_path, model_path):
+            # Only backend="onnx" re-exports; in auto mode a stale graph is skipped
+            logger.warning(f"ONNX model {onnx_path} is older than {model_path}, ignoring it. Set MODEL_BACKEND=onnx to re-export")
+        else:
+            try:
+                model = OnnxModel(onnx_path)
+                logger.info(f" Using ONNX Runtime model from {onnx_path}")
+                return model
+            except Exception as e:
+                logger.warning(f"Could not load ONNX model ({e}), falling back to PyTorch")
+
+    model = fuse_conv_bn(load_fp32_model(model_path))
+
+    if backend == "compile":
+        try:
+            compiled = compile_model(model)
+            warmup(compiled, runs=1)  # Compile now, not on the first request
+            logger.info(" Using torch.compile model")
+            return compiled
+        except Exception as e:
+            logger.warning(f"torch.compile failed ({e}), falling back to TorchScript")
+            torch.set_float32_matmul_precision("highest")
+
+    try:
+        return optimize_for_cpu(model)
+    except Exception as e:
+        # The eager model is still correct, just slower
+        logger.warning(f"TorchScript optimization failed, serving eager model: {e}")
+        return model
+
+
+# --- PROCESS POOL WORKERS ---
+# Each worker process loads its own copy of the model once, in the initializer,
+# so requests only ship the raw file bytes and filename across the process boundary.
+_worker_model = None
+
+
+def init_worker(
+    model_path: Path,
+    int8_path: Optional[Path] = None,
+    onnx_path: Optional[Path] = None,
+    num_threads: Optional[int] = None,
+    backend: str = "auto"
+):
+    """
+    ProcessPoolExecutor initializer: loads the model in the worker process.
+    `num_threads` is this worker's share of the cores, applied before the model
+    is built so the ONNX session and warmup use it too.
+    """
+    global _worker_model
+    _worker_model = load_model(model_path, int8_path, onnx_path, backend, num_threads=num_threads)
+
+
+def process_bytes(file_bytes: bytes, filename: str) -> Dict[str, Any]:
+    """Runs the full pipeline inside a worker process."""
+    if _worker_model is None:
+        raise RuntimeError("Worker model not loaded. Use init_worker as the pool initializer.")
+    return extract_and_process_image(
+        file_stream=file_bytes,
+        filename=filename,
+        model=_worker_model,
+        max_scores=MAX_SCORES
+    )
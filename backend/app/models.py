@@ -1,6 +1,6 @@
 # backend/app/models.py
 
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, Text
 from sqlalchemy.sql import func
 from .database import Base  # Import Base from your database.py, don't create a new one!
 from sqlalchemy.orm import Mapped, mapped_column
@@ -16,6 +16,9 @@ class ImageScore(Base):
     serial_number = Column(String, index=True) # e.g., "S-3602-01" (Unique ID)
     sample_id = Column(String, index=True)     # e.g., "S-3602"    (Group ID)
 
+    # Thumbnail shown in the UI (Base64 data URL), saved so re-uploads skip the TIFF decode
+    thumbnail_url = Column(Text)
+
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     # This automatically updates whenever you overwrite a row
@@ -30,5 +33,10 @@ class ImageScore(Base):
     # Total Score
     score_total: Mapped[float] = mapped_column(Float)
 
+    # Composite index for dashboard listings: filter by sample, newest first
+    __table_args__ = (
+        Index("ix_image_scores_sample_created", "sample_id", created_at.desc()),
+    )
+
     def __repr__(self):
         return f"<ImageScore(id={self.id}, serial='{self.serial_number}', total={self.score_total})>"
\ No newline at end of file
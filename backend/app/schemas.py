@@ -0,0 +1,30 @@
+# backend/app/schemas.py
+
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+# Response models. With a declared return type FastAPI serializes straight to
+# JSON bytes in pydantic-core (Rust), skipping the pure-Python jsonable_encoder
+# pass over the large Base64 display_url.
+
+
+class UploadResult(BaseModel):
+    status: str
+    filename: str
+    serial_number: Optional[str] = None
+    sample_id: Optional[str] = None
+    scores: Dict[str, Optional[float]]
+    display_url: Optional[str] = None
+    db_id: Optional[int] = None
+
+
+class BatchResult(BaseModel):
+    status: str
+    count: int
+    results: List[UploadResult]
+
+
+class UpdateResult(BaseModel):
+    status: str
+    new_total: float
@@ -2,15 +2,28 @@
 
 import torch
 import torch.nn as nn
-from torchvision import models, transforms
+from torchvision import models
+from torchvision.transforms import v2 as transforms
 from PIL import Image
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Union, Callable
 import numpy as np
-import base64            
 from io import BytesIO   
 import re
+import os
+import hashlib
 import logging
+import threading
+
+try:
+    import pybase64 as base64  # SIMD (AVX2/AVX-512/NEON) Base64, same API as the stdlib
+except ImportError:
+    import base64
+
+try:
+    import pyvips
+except (ImportError, OSError):  # Optional: Pillow handles everything without libvips
+    pyvips = None
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +33,31 @@ NUM_CLASSES = 4
 MAX_SCORES = np.array([4.0, 3.0, 3.0, 4.0], dtype=np.float32)
 MAX_FILE_SIZE = 100 * 1024 * 1024
 
+# Filename parsing in one match, e.g. "S-3602-10X_Image001_ch00.tif" -> image "001", sample "S-3602".
+# The lookahead finds "Image<digits>" anywhere without consuming, then the sample prefix
+# (everything up to the second dash) is matched from the start. Both groups are optional.
+_FILENAME_RE = re.compile(r"^(?=(?:.*?Image(\d+))?)(?:([^-]*-[^-]*))?", re.IGNORECASE | re.DOTALL)
+
+# Thumbnail encoding: JPEG by default, PNG only if transparency/palette must survive
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "JPEG").upper()
+# MIME subtype of each supported format, for the data URL
+THUMBNAIL_MIME_SUBTYPES = {"JPEG": "jpeg", "PNG": "png"}
+if THUMBNAIL_FORMAT not in THUMBNAIL_MIME_SUBTYPES:
+    raise ValueError(f"Unknown THUMBNAIL_FORMAT '{THUMBNAIL_FORMAT}'. Expected one of {tuple(THUMBNAIL_MIME_SUBTYPES)}")
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_SIZE = 400
+
+# Optional: write thumbnails to THUMBNAIL_DIR (served at THUMBNAIL_URL_PATH) and return
+# their URL instead of an inline Base64 data URL. Files are content-addressed, so
+# they never change and can be cached forever.
+THUMBNAIL_DIR = Path(os.environ["THUMBNAIL_DIR"]) if os.getenv("THUMBNAIL_DIR") else None
+THUMBNAIL_URL_PATH = "/static/thumbs"
+
+# Image decoder: Pillow by default. IMAGE_BACKEND=vips decodes with libvips instead,
+# which releases the GIL and is faster on large TIFFs; its resize uses the same
+# linear kernel as MODEL_TRANSFORMS, so scores agree with Pillow to ~1e-2.
+USE_VIPS = pyvips is not None and os.getenv("IMAGE_BACKEND", "pillow").lower() == "vips"
+
 SCORE_FIELDS = {
     "Pancreatic Architecture": "score_architecture",
     "Glandular Atrophy": "score_atrophy",
@@ -27,12 +65,27 @@ SCORE_FIELDS = {
     "Fibrosis": "score_fibrosis"
 }
 
+# Model output order
+SCORE_LABELS = tuple(SCORE_FIELDS)
+
+# ImageNet normalization, pre-shaped for [C, H, W] tensors so no per-call allocation is needed
+MEAN = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
+INV_STD = 1.0 / torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
+
+def normalize_(tensor: torch.Tensor) -> torch.Tensor:
+    """In-place (x - mean) / std on a freshly converted float tensor."""
+    return tensor.sub_(MEAN).mul_(INV_STD)
+
 # Standard transforms (same as training)
+# Training resized every image to 512x512 and then applied Resize(256) + CenterCrop(224).
+# Resizing straight to 256x256 keeps the same square geometry without the 512 intermediate,
+# and everything runs on a uint8 tensor until the final crop is converted to float.
 MODEL_TRANSFORMS = transforms.Compose([
-    transforms.Resize(256),
+    transforms.PILToTensor(),
+    transforms.Resize((256, 256), antialias=True),
     transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    transforms.ToDtype(torch.float32, scale=True),
+    normalize_
 ])
 
 def get_model():
@@ -42,44 +95,115 @@ def get_model():
     model.fc = nn.Linear(num_ftrs, NUM_CLASSES)
     return model
 
+def preprocess(image: Image.Image) -> torch.Tensor:
+    """RGB image -> normalized [3, 224, 224] model input."""
+    return MODEL_TRANSFORMS(image)
+
+def postprocess_batch(outputs: torch.Tensor) -> List[Dict[str, float]]:
+    """Raw model outputs [B, 4] (values in 0-1) -> one score dict with Total per row."""
+    # Vectorized over the whole batch. The first multiply allocates a new array
+    # (numpy() shares memory with a CPU tensor), the remaining steps reuse it.
+    out = np.multiply(outputs.detach().cpu().numpy(), MAX_SCORES)
+    
+    # Scale back to real range (e.g. 0-4), clamp, and round to the nearest 0.25
+    np.clip(out, 0, MAX_SCORES, out=out)
+    np.multiply(out, 4, out=out)
+    np.round(out, out=out)
+    np.divide(out, 4, out=out)
+
+    # Quarter steps are exact in float32, so the row sums are too
+    totals = out.sum(axis=1).tolist()
+
+    # tolist() converts every value to a Python float in one C call
+    return [
+        {**dict(zip(SCORE_LABELS, values)), 'Total': round(total, 2)}
+        for values, total in zip(out.tolist(), totals)
+    ]
+
+def postprocess(output: torch.Tensor) -> Dict[str, float]:
+    """One row of raw model output (4 values in 0-1) -> score dict with Total."""
+    return postprocess_batch(output.unsqueeze(0))[0]
+
 def predict_scores(image: Image.Image, model: nn.Module) -> Dict[str, float]:
     """Inference Logic."""
     
-    # 1. Force Resize to 512x512 (Match Training Preprocessing)
-    image = image.resize((512, 512))
-    
-    # 2. Transform for PyTorch
-    input_tensor = MODEL_TRANSFORMS(image)
-    input_batch = input_tensor.unsqueeze(0)  
+    # 1. Transform for PyTorch (decode -> resize -> crop -> normalize in one pipeline)
+    input_batch = preprocess(image).unsqueeze(0)
     
     device = torch.device("cpu")
     
-    with torch.no_grad():
-        input_batch = input_batch.to(device)
+    with torch.inference_mode():
+        # NHWC lets oneDNN use its packed convolution kernels (model is channels_last too)
+        input_batch = input_batch.to(device, memory_format=torch.channels_last)
         output = model(input_batch)
     
-    # 3. Post-Process Output
-    # Get raw 0-1 values
-    normalized_scores = output.cpu().numpy().flatten()
-    
-    # Scale back to real range (e.g. 0-4)
-    actual_scores = normalized_scores * MAX_SCORES
+    # 2. Post-Process Output
+    return postprocess(output[0])
+
+def decode_image(file_bytes: bytes, draft_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    Decodes uploaded image bytes ONCE into an RGB image held in memory.
+    The model input and the thumbnail are both built from this one decode.
+    With `draft_size`, formats that support it (JPEG and JPEG-compressed data)
+    decode at the smallest scale still at least that size. Thumbnail-only: the
+    model input must come from the full-resolution decode, like in training.
+    """
+    img = Image.open(BytesIO(file_bytes))
+    if draft_size is not None:
+        img.draft('RGB', draft_size)
+    if img.mode != 'RGB':
+        return img.convert('RGB')  # convert() decodes into a new in-memory image
+    img.load()
+    return img
+
+def prepare_image(file_bytes: bytes, filename: str) -> Tuple[torch.Tensor, Dict[str, Any]]:
+    """
+    Everything except the forward pass: decodes the image once and returns
+    the model input tensor plus the response fields (metadata + thumbnail).
+    Lets the API batch forward passes across requests (see app.batching).
+    """
+    metadata = parse_filename(filename)
+
+    if USE_VIPS:
+        # One decode shared by the model input and the thumbnail
+        img = vips_decode(file_bytes)
+        input_tensor = vips_preprocess(img)
+        display_url = publish_thumbnail(file_bytes, lambda: vips_encode_thumbnail(img))
+    else:
+        img = decode_image(file_bytes)
+        
+        # The transforms copy the pixels into a tensor first
+        input_tensor = preprocess(img)
+        
+        # Thumbnail last: it shrinks the image in place
+        display_url = publish_thumbnail(file_bytes, lambda: encode_thumbnail(img))
+
+    return input_tensor, {
+        "serial_number": metadata["serial_number"],
+        "sample_id": metadata["sample_id"],
+        "display_url": display_url
+    }
+
+def predict_scores_batch(images: List[Image.Image], model: nn.Module) -> List[Dict[str, float]]:
+    """Scores several images with a single forward pass."""
+    # Stacking HWC views builds the batch directly in channels_last order (one copy)
+    batch = torch.stack([preprocess(image).permute(1, 2, 0) for image in images]).permute(0, 3, 1, 2)
     
-    # Clamp to be safe (no negatives or huge numbers)
-    actual_scores = np.clip(actual_scores, 0, MAX_SCORES)
+    with torch.inference_mode():
+        outputs = model(batch)
     
-    def round_quarter(num):
-        return round(num * 4) / 4
-
-    scores = {
-        "Pancreatic Architecture": round_quarter(float(actual_scores[0])),
-        "Glandular Atrophy": round_quarter(float(actual_scores[1])),
-        "Pseudotubular Complexes": round_quarter(float(actual_scores[2])),
-        "Fibrosis": round_quarter(float(actual_scores[3])),
+    return postprocess_batch(outputs)
+
+def build_result(filename: str, info: Dict[str, Any], scores: Dict[str, float]) -> Dict[str, Any]:
+    """Assembles the upload response for a freshly scored image."""
+    return {
+        "status": "success",
+        "filename": filename,
+        "serial_number": info["serial_number"],
+        "sample_id": info["sample_id"],
+        "scores": scores,
+        "display_url": info["display_url"]
     }
-    scores['Total'] = round(sum(scores.values()), 2)
-    
-    return scores
 
 def extract_and_process_image(
     file_stream: bytes,          
@@ -89,70 +213,159 @@ def extract_and_process_image(
 ) -> Dict[str, Any]:
     """Main pipeline - In-Memory Version"""
     
-    # 1. Generate metadata and thumbnail (reuse helper)
-    metadata = generate_thumbnail_and_metadata(file_stream, filename)
-    
     try:
-        # 2. Open image and run AI prediction
-        with Image.open(BytesIO(file_stream)) as img:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Predict scores
-            scores = predict_scores(img, model)
-            
-            return {
-                "status": "success",
-                "filename": filename,
-                "serial_number": metadata["serial_number"],
-                "sample_id": metadata["sample_id"],
-                "scores": scores,
-                "display_url": metadata["display_url"]
-            }
+        # 1. Decode ONCE: model input, metadata and thumbnail
+        input_tensor, info = prepare_image(file_stream, filename)
+        
+        # 2. Predict scores
+        with torch.inference_mode():
+            input_batch = input_tensor.unsqueeze(0).to(memory_format=torch.channels_last)
+            output = model(input_batch)
+        
+        return build_result(filename, info, postprocess(output[0]))
             
     except Exception as e:
         print(f"Error processing: {e}")
         raise e
     
 
+def parse_filename(filename: str) -> Dict[str, str]:
+    """
+    Extracts sample_id and serial_number from a filename.
+    e.g. "S-3602-10X_Image001_ch00.tif" -> sample "S-3602", serial "S-3602-01"
+    """
+    # The pattern always matches; missing parts come back as ""
+    raw_num, sample_id = _FILENAME_RE.match(filename).groups("")
+    sample_id = sample_id or "UNKNOWN"
+    
+    # Last two digits of the image number, zero-padded ("" -> "00", "7" -> "07")
+    image_suffix = raw_num.zfill(2)[-2:]
+
+    return {
+        "serial_number": f"{sample_id}-{image_suffix}",
+        "sample_id": sample_id
+    }
+
+
+def encode_thumbnail(img: Image.Image) -> memoryview:
+    """
+    Downscales an RGB image to at most 400x400 and returns the encoded thumbnail
+    as a zero-copy view of the encode buffer.
+    The image is resized IN PLACE (no full-resolution copy), so call this after
+    anything else that needs the original pixels.
+    """
+    # BILINEAR hits the SIMD resample path in Pillow-SIMD
+    img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.BILINEAR)
+    
+    # JPEG encodes much faster than PNG and gives a far smaller payload for tissue images
+    buffered = BytesIO()
+    if THUMBNAIL_FORMAT == "PNG":
+        img.save(buffered, format="PNG")
+    else:
+        img.save(buffered, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=False)
+    # getbuffer() hands the encoder's bytes straight to Base64 / the file write;
+    # getvalue() would copy them into a new bytes object first
+    return buffered.getbuffer()
+
+
+def make_thumbnail(img: Image.Image) -> str:
+    """Thumbnail as a Base64 data URL (see encode_thumbnail; resizes `img` in place)."""
+    return to_data_url(encode_thumbnail(img))
+
+
+def to_data_url(encoded: Union[bytes, memoryview]) -> str:
+    """Wraps an encoded thumbnail in a Base64 data URL."""
+    # Build the data URL as bytes and decode to str once
+    prefix = f"data:image/{THUMBNAIL_MIME_SUBTYPES[THUMBNAIL_FORMAT]};base64,".encode("ascii")
+    return (prefix + base64.b64encode(encoded)).decode("ascii")
+
+
+def publish_thumbnail(file_bytes: bytes, render: Callable[[], Union[bytes, memoryview]]) -> str:
+    """
+    Returns the display_url for an upload's thumbnail.
+    Without THUMBNAIL_DIR this is an inline data URL. Otherwise the thumbnail is
+    written once to THUMBNAIL_DIR/<content hash>.<ext> and its path under
+    THUMBNAIL_URL_PATH is returned; `render` is skipped if the file already exists.
+    """
+    if THUMBNAIL_DIR is None:
+        return to_data_url(render())
+
+    extension = "png" if THUMBNAIL_FORMAT == "PNG" else "jpg"
+    name = f"{hashlib.blake2b(file_bytes, digest_size=16).hexdigest()}.{extension}"
+    path = THUMBNAIL_DIR / name
+    if not path.exists():
+        # Write then rename, so a concurrent request never serves a partial file
+        tmp_path = path.with_name(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(render())
+        os.replace(tmp_path, path)
+    return f"{THUMBNAIL_URL_PATH}/{name}"
+
+
+# --- LIBVIPS PATH (optional) ---
+def _vips_rgb(img: "pyvips.Image") -> "pyvips.Image":
+    """8-bit sRGB, 3 bands (alpha dropped like Pillow's convert('RGB'))."""
+    if img.interpretation != "srgb":
+        img = img.colourspace("srgb")
+    if img.format != "uchar":
+        img = img.cast("uchar")
+    if img.bands > 3:
+        img = img.extract_band(0, n=3)
+    return img
+
+
+def vips_decode(file_bytes: bytes) -> "pyvips.Image":
+    """Decodes the upload once into memory as 8-bit RGB, like decode_image()."""
+    return _vips_rgb(pyvips.Image.new_from_buffer(file_bytes, "")).copy_memory()
+
+
+def vips_encode_thumbnail(img: "pyvips.Image") -> bytes:
+    """Shrinks a libvips image to fit THUMBNAIL_SIZE and encodes it."""
+    thumb = _vips_rgb(img.thumbnail_image(THUMBNAIL_SIZE, height=THUMBNAIL_SIZE))
+    if THUMBNAIL_FORMAT == "PNG":
+        return thumb.write_to_buffer(".png")
+    return thumb.write_to_buffer(f".jpg[Q={THUMBNAIL_QUALITY}]")
+
+
+def vips_preprocess(img: "pyvips.Image") -> torch.Tensor:
+    """
+    libvips equivalent of MODEL_TRANSFORMS: antialiased linear resize to 256x256,
+    center crop 224, then scale + normalize to a [3, 224, 224] tensor.
+    """
+    # gap=0: no box-filter pre-shrink, so large reductions match Pillow's antialiased bilinear
+    img = img.resize(256 / img.width, vscale=256 / img.height, kernel="linear", gap=0)
+    img = img.crop(16, 16, 224, 224)
+    pixels = bytearray(img.write_to_memory())
+    tensor = torch.frombuffer(pixels, dtype=torch.uint8).view(224, 224, 3).permute(2, 0, 1)
+    return normalize_(tensor.to(torch.float32).div_(255))
+
+
 def generate_thumbnail_and_metadata(
-    file_bytes: bytes,
+    file_bytes: Union[bytes, Image.Image],
     filename: str
 ) -> Dict[str, Any]:
     """
     Extracts metadata from filename and generates Base64 thumbnail.
-    Used for both new uploads and existing DB records.
+    Used for existing DB records, where no inference is needed.
+    Accepts raw bytes or an image already returned by decode_image().
     """
-    # --- PARSING LOGIC (Same as in extract_and_process_image) ---
-    sample_id = "UNKNOWN"
-    image_suffix = "00"
-    
-    parts = filename.split("-")
-    if len(parts) >= 2:
-        sample_id = f"{parts[0]}-{parts[1]}"
-
-    match = re.search(r"Image(\d+)", filename, re.IGNORECASE)
-    if match:
-        raw_num = match.group(1)
-        image_suffix = raw_num[-2:] if len(raw_num) >= 2 else raw_num.zfill(2)
+    metadata = parse_filename(filename)
 
-    full_serial = f"{sample_id}-{image_suffix}"
-
-    # --- THUMBNAIL GENERATION ---
-    with Image.open(BytesIO(file_bytes)) as img:
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        img_thumb = img.copy()
-        img_thumb.thumbnail((400, 400))
-        
-        buffered = BytesIO()
-        img_thumb.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        base64_url = f"data:image/png;base64,{img_str}"
+    if isinstance(file_bytes, Image.Image):
+        # No bytes to hash, so always inline
+        display_url = make_thumbnail(file_bytes)
+    elif USE_VIPS:
+        # Only a thumbnail is needed, so stream the bytes instead of decoding to memory
+        display_url = publish_thumbnail(
+            file_bytes,
+            lambda: vips_encode_thumbnail(pyvips.Image.new_from_buffer(file_bytes, "", access="sequential"))
+        )
+    else:
+        # Only a thumbnail is needed, so let the decoder skip detail it would throw away
+        thumb_size = (THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        display_url = publish_thumbnail(file_bytes, lambda: encode_thumbnail(decode_image(file_bytes, thumb_size)))
     
     return {
-        "serial_number": full_serial,
-        "sample_id": sample_id,
-        "display_url": base64_url
-    }
\ No newline at end of file
+        "serial_number": metadata["serial_number"],
+        "sample_id": metadata["sample_id"],
+        "display_url": display_url
+    }
@@ -0,0 +1,13 @@
+# backend/export_onnx.py
+
+from pathlib import Path
+
+from app.inference import export_onnx, load_fp32_model
+
+MODEL_PATH = Path("pancreas_model.pth")
+ONNX_MODEL_PATH = Path("pancreas.onnx")
+
+if __name__ == "__main__":
+    # One-off export; the API picks up pancreas.onnx on its next start
+    export_onnx(load_fp32_model(MODEL_PATH), ONNX_MODEL_PATH)
+    print(f"ONNX model saved to: {ONNX_MODEL_PATH}")
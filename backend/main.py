@@ -1,49 +1,83 @@
 import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from contextlib import asynccontextmanager
 import logging
-from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy import text
-import torch
+from sqlalchemy import func, select, text, update
 import uvicorn
 
 # --- APP IMPORTS ---
-from app import models, database
+from app import models, database, crud, cache, schemas
 from app.utils import (
-    extract_and_process_image, 
-    get_model, 
-    MAX_SCORES, 
+    prepare_image,
+    postprocess,
+    postprocess_batch,
+    build_result,
     generate_thumbnail_and_metadata, 
     MAX_FILE_SIZE, 
-    SCORE_FIELDS
+    SCORE_FIELDS,
+    THUMBNAIL_DIR,
+    THUMBNAIL_URL_PATH
 )
+from app.batching import Batcher
+from app.inference import load_model, init_worker, process_bytes
 
 MODEL_PATH = Path("pancreas_model.pth")
+INT8_MODEL_PATH = Path("pancreas_model_int8.pt")  # Optional, produced by quantize_model.py
+ONNX_MODEL_PATH = Path("pancreas.onnx")  # Optional, produced by export_onnx.py or MODEL_BACKEND=onnx
+
+# "auto", "onnx" (export + serve with ONNX Runtime), "torch" or "compile" (see app.inference)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "auto").lower()
+
+# Number of worker processes for inference (0 = run in-process on a thread)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+
+# Uvicorn worker processes (uvicorn's CLI reads the same variable for --workers).
+# Each worker loads its own model, so the cores are split between them.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+CPU_THREADS = max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+
+# Dedicated threads for decode + inference + thumbnails. Kept apart from
+# FastAPI's shared threadpool so CPU work can't starve other blocking calls.
+INFER_POOL = ThreadPoolExecutor(max_workers=CPU_THREADS, thread_name_prefix="inference")
+
+# Seconds a successful health-check DB ping is reused, so frequent load balancer
+# probes don't each check out a pooled connection
+HEALTH_DB_TTL = 5.0
 
 # --- LOGGING ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- DATABASE INIT ---
-models.Base.metadata.create_all(bind=database.engine)
-
 # --- LIFESPAN CONTEXT MANAGER ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Load model on startup, cleanup on shutdown."""
+    # Startup: Create tables
+    async with database.engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+    # Startup: Optional Redis cache for duplicate uploads
+    app.state.redis = cache.connect()
+
     # Startup: Load model
     logger.info("Loading AI model...")
     try:
-        app.state.model = get_model()
-        app.state.model.load_state_dict(
-            torch.load(MODEL_PATH, map_location=torch.device('cpu'), weights_only=False)
-        )
-        app.state.model.eval()
+        model = load_model(MODEL_PATH, INT8_MODEL_PATH, ONNX_MODEL_PATH, MODEL_BACKEND, num_threads=CPU_THREADS)
+
+        # Coalesce concurrent uploads into one forward pass
+        app.state.model = Batcher(model).start()
         logger.info(f" Model loaded successfully from {MODEL_PATH}")
     except FileNotFoundError:
         logger.error(f"!!! Model file not found at {MODEL_PATH}")
@@ -51,15 +85,85 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"!!! Error loading model: {e}", exc_info=True)
         app.state.model = None
+
+    # Optional process pool: escapes the GIL for decode + inference
+    app.state.pool = None
+    if INFERENCE_WORKERS > 0 and app.state.model is not None:
+        app.state.pool = ProcessPoolExecutor(
+            max_workers=INFERENCE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(
+                MODEL_PATH, INT8_MODEL_PATH, ONNX_MODEL_PATH,
+                # Split this server process's cores between its workers instead of oversubscribing them
+                max(1, CPU_THREADS // INFERENCE_WORKERS), MODEL_BACKEND
+            )
+        )
+        logger.info(f" Inference process pool started with {INFERENCE_WORKERS} workers")
     
     yield  # App runs here
     
     # Shutdown: Clean up
     logger.info("Shutting down...")
+    if app.state.pool is not None:
+        app.state.pool.shutdown(wait=True)
+    if isinstance(getattr(app.state, 'model', None), Batcher):
+        await app.state.model.stop()
+    if app.state.redis is not None:
+        await app.state.redis.aclose()
+    await database.engine.dispose()
 
 # --- APP INITIALIZATION ---
 app = FastAPI(lifespan=lifespan)
 
+# --- UPLOAD SIZE LIMIT ---
+# Slack for the multipart boundary and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# /api/upload-batch/ holds every file in memory at once, so it gets a file count
+# cap and a total budget on top of the per-file MAX_FILE_SIZE
+MAX_BATCH_FILES = 50
+MAX_BATCH_SIZE = 500 * 1024 * 1024
+
+def too_large() -> HTTPException:
+    return HTTPException(413, f"File too large. Max: {MAX_FILE_SIZE / 1024 / 1024:.1f} MB")
+
+def batch_too_large() -> HTTPException:
+    return HTTPException(413, f"Batch too large. Max: {MAX_BATCH_SIZE / 1024 / 1024:.1f} MB in total")
+
+@app.middleware("http")
+async def reject_oversized_upload(request: Request, call_next):
+    """
+    Rejects uploads whose Content-Length already exceeds the limit,
+    before Starlette reads and spools the multipart body.
+    Registered before CORS so the 413 still carries CORS headers.
+    """
+    content_length = request.headers.get("content-length", "0")
+    error = None
+    if request.url.path == "/api/upload-image/":
+        if content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+            error = too_large()
+    elif request.url.path == "/api/upload-batch/":
+        if content_length.isdigit() and int(content_length) > MAX_BATCH_SIZE + MAX_BATCH_FILES * MULTIPART_OVERHEAD:
+            error = batch_too_large()
+    if error is not None:
+        return JSONResponse(status_code=error.status_code, content={"detail": error.detail})
+    return await call_next(request)
+
+# --- STATIC THUMBNAILS (optional, THUMBNAIL_DIR) ---
+if THUMBNAIL_DIR is not None:
+    THUMBNAIL_DIR.mkdir(parents=True, exist_ok=True)
+    app.mount(THUMBNAIL_URL_PATH, StaticFiles(directory=THUMBNAIL_DIR), name="thumbnails")
+
+    @app.middleware("http")
+    async def cache_thumbnails(request: Request, call_next):
+        """Thumbnail names are content hashes, so browsers may cache them forever."""
+        response = await call_next(request)
+        if request.url.path.startswith(THUMBNAIL_URL_PATH + "/") and response.status_code == 200:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
 # --- CORS ---
 env_origins = os.getenv("ALLOWED_ORIGINS", "")
 if env_origins:
@@ -82,12 +186,28 @@ app.add_middleware(
 async def read_root():
     return {"message": "AI Scoring API Ready"}
 
+# Monotonic time until which the last successful DB ping still counts
+_db_ok_until = 0.0
+_db_probe_lock = asyncio.Lock()
+
+async def check_database(db: AsyncSession):
+    """Runs SELECT 1 at most once per HEALTH_DB_TTL; failures are never cached."""
+    global _db_ok_until
+    if time.monotonic() < _db_ok_until:
+        return
+    async with _db_probe_lock:
+        # Another probe may have refreshed it while we waited
+        if time.monotonic() < _db_ok_until:
+            return
+        await db.execute(text("SELECT 1"))
+        _db_ok_until = time.monotonic() + HEALTH_DB_TTL
+
 @app.get("/health")
-async def health_check(request: Request, db: Session = Depends(database.get_db)):
+async def health_check(request: Request, db: AsyncSession = Depends(database.get_db)):
     """Health check for load balancers."""
     try:
         # Check DB connection
-        db.execute(text("SELECT 1"))
+        await check_database(db)
         
         # Check model loaded
         if not hasattr(request.app.state, 'model') or request.app.state.model is None:
@@ -102,147 +222,323 @@ async def health_check(request: Request, db: Session = Depends(database.get_db))
         logger.error(f"Health check failed: {e}")
         raise HTTPException(503, f"Unhealthy: {str(e)}")
 
-@app.post("/api/upload-image/")
-async def upload_image(
-    request: Request,  
-    file: UploadFile = File(...),
-    db: Session = Depends(database.get_db)
-):
+def validate_upload(file: UploadFile) -> str:
+    """Checks the file type, returning the filename to store."""
     safe_filename = file.filename or "unknown_file.tif"
 
-    # 1. Validation - File type
+    # Validation - File type
     if not safe_filename.lower().endswith(('.tif', '.tiff')):
         raise HTTPException(400, "Only .tif files supported")
     
-    # 2. Validation - File size
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            413, 
-            f"File too large ({file_size / 1024 / 1024:.1f} MB). Max: {MAX_FILE_SIZE / 1024 / 1024:.1f} MB"
-        )
+    return safe_filename
+
+async def read_upload(file: UploadFile, budget: Optional[int] = None) -> bytes:
+    """
+    Reads the upload in chunks, failing with 413 as soon as it passes MAX_FILE_SIZE
+    or, within a batch, the `budget` of bytes the batch has left.
+    """
+    buffer = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        buffer.extend(chunk)
+        if len(buffer) > MAX_FILE_SIZE:
+            raise too_large()
+        if budget is not None and len(buffer) > budget:
+            raise batch_too_large()
+    return bytes(buffer)
+
+async def run_inference(request: Request, file_bytes: bytes, filename: str) -> dict:
+    """
+    Runs decode + inference + thumbnail off the event loop.
+    Decode and thumbnail run on INFER_POOL; the forward pass goes through the
+    shared Batcher so concurrent uploads are scored together.
+    """
+    loop = asyncio.get_running_loop()
+    pool = getattr(request.app.state, 'pool', None)
+    if pool is not None:
+        return await loop.run_in_executor(pool, process_bytes, file_bytes, filename)
+
+    input_tensor, info = await loop.run_in_executor(INFER_POOL, prepare_image, file_bytes, filename)
+    output = await request.app.state.model.submit(input_tensor)  #  Use app.state.model
+    return build_result(filename, info, postprocess(output))
+
+async def run_inference_batch(request: Request, items: List[Tuple[bytes, str]]) -> List[dict]:
+    """
+    Scores several uploads together. Every file is decoded first and the
+    tensors are queued at once, so the Batcher fuses them into as few forward
+    passes as possible instead of whatever finished decoding within its timeout.
+    """
+    if not items:
+        return []
+
+    loop = asyncio.get_running_loop()
+    pool = getattr(request.app.state, 'pool', None)
+    if pool is not None:
+        return list(await asyncio.gather(*(
+            loop.run_in_executor(pool, process_bytes, file_bytes, filename) for file_bytes, filename in items
+        )))
+
+    prepared = await asyncio.gather(*(
+        loop.run_in_executor(INFER_POOL, prepare_image, file_bytes, filename) for file_bytes, filename in items
+    ))
+    outputs = await request.app.state.model.submit_many([tensor for tensor, _ in prepared])
+    return [
+        build_result(filename, info, scores)
+        for (_, filename), (_, info), scores in zip(items, prepared, postprocess_batch(outputs))
+    ]
+
+async def run_thumbnail(file_bytes: bytes, filename: str) -> dict:
+    """Builds the thumbnail + metadata for a cached file off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(INFER_POOL, generate_thumbnail_and_metadata, file_bytes, filename)
+
+# In-process lock per filename, dropped once nobody holds or waits for it
+_upload_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+@asynccontextmanager
+async def upload_lock(filename: str):
+    """Serializes uploads of the same filename within this worker."""
+    lock, users = _upload_locks.get(filename, (None, 0))
+    lock = lock or asyncio.Lock()
+    _upload_locks[filename] = (lock, users + 1)
+    try:
+        async with lock:
+            yield
+    finally:
+        lock, users = _upload_locks[filename]
+        if users == 1:
+            del _upload_locks[filename]
+        else:
+            _upload_locks[filename] = (lock, users - 1)
+
+def for_client(request: Request, result: dict) -> dict:
+    """
+    Makes a stored thumbnail path absolute. The frontend runs on another origin,
+    so "/static/thumbs/..." must point at this API. Data URLs pass through.
+    """
+    display_url = result.get("display_url")
+    if display_url and display_url.startswith("/"):
+        return {**result, "display_url": str(request.base_url).rstrip("/") + display_url}
+    return result
+
+async def stored_thumbnail(record: models.ImageScore, file_bytes: bytes) -> str:
+    """
+    Returns the record's saved thumbnail. Rows saved before thumbnails were
+    persisted get one built from the upload and stored on the record.
+    """
+    if record.thumbnail_url is None:
+        metadata = await run_thumbnail(file_bytes, record.filename)
+        record.thumbnail_url = metadata["display_url"]
+    return record.thumbnail_url
+
+def cached_result(record: models.ImageScore, display_url: str) -> dict:
+    """Builds the upload response for a file that is already in the database."""
+    return {
+        "status": "success",
+        "filename": record.filename,
+        "serial_number": record.serial_number,
+        "sample_id": record.sample_id,
+        "scores": {
+            "Pancreatic Architecture": record.score_architecture,
+            "Glandular Atrophy": record.score_atrophy,
+            "Pseudotubular Complexes": record.score_complexes,
+            "Fibrosis": record.score_fibrosis,
+            "Total": record.score_total
+        },
+        "display_url": display_url,
+        "db_id": record.id
+    }
+
+@app.post("/api/upload-image/")
+async def upload_image(
+    request: Request,  
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(database.get_db)
+) -> schemas.UploadResult:
+    # 1. Validation - File type
+    safe_filename = validate_upload(file)
     
-    # 3. Validation - Model loaded
+    # 2. Validation - Model loaded
     if request.app.state.model is None:
         raise HTTPException(503, "AI Model not loaded")
 
+    redis = getattr(request.app.state, 'redis', None)
+
     try:
-        # 4. CHECK DATABASE FIRST
-        existing_record = db.query(models.ImageScore).filter(
-            models.ImageScore.filename == safe_filename
-        ).first()
+        # 3. Read the file, enforcing the size limit as it streams in
+        file_bytes = await read_upload(file)
 
-        if existing_record:
-            logger.info(f" Found existing record for {safe_filename}. Skipping AI inference.")
-            
-            # Read file and generate thumbnail + metadata
-            file_bytes = await file.read()
-            metadata = generate_thumbnail_and_metadata(file_bytes, safe_filename)
+        # Concurrent uploads of the same file wait here, then take the cached path
+        # below instead of running inference twice
+        async with upload_lock(safe_filename):
+            # 4. CHECK CACHE, THEN DATABASE
+            cached = await cache.get_score(redis, safe_filename)
+            if cached and "display_url" in cached:
+                logger.info(f" Cache hit for {safe_filename}. Skipping AI inference.")
+                return for_client(request, cached)
+
+            stmt = select(models.ImageScore).where(models.ImageScore.filename == safe_filename)
+            existing_record = (await db.execute(stmt)).scalar_one_or_none()
+
+            if existing_record:
+                logger.info(f" Found existing record for {safe_filename}. Skipping AI inference.")
             
-            # Build result from existing DB record
-            result = {
-                "status": "success",
-                "filename": existing_record.filename,
-                "serial_number": metadata["serial_number"],
-                "sample_id": metadata["sample_id"],
-                "scores": {
-                    "Pancreatic Architecture": existing_record.score_architecture,
-                    "Glandular Atrophy": existing_record.score_atrophy,
-                    "Pseudotubular Complexes": existing_record.score_complexes,
-                    "Fibrosis": existing_record.score_fibrosis,
-                    "Total": existing_record.score_total
-                },
-                "display_url": metadata["display_url"],
-                "db_id": existing_record.id
-            }
+                # Build result from existing DB record (no TIFF decode needed)
+                display_url = await stored_thumbnail(existing_record, file_bytes)
+                result = cached_result(existing_record, display_url)
             
-            # Update timestamp
-            existing_record.timestamp = datetime.now()
-            db.commit()
+                await db.commit()  # Saves a backfilled thumbnail, if any
             
-            return result
+                await cache.set_score(redis, result)
+                return for_client(request, result)
 
-        # 5. ⚡ NEW FILE: Run AI inference
-        logger.info(f"New file {safe_filename}. Running AI inference...")
-        file_bytes = await file.read()
+            # 5. ⚡ NEW FILE: Run AI inference
+            logger.info(f"New file {safe_filename}. Running AI inference...")
         
-        result = extract_and_process_image(
-            file_stream=file_bytes,
-            filename=safe_filename,
-            model=request.app.state.model,  #  Use app.state.model
-            max_scores=MAX_SCORES
-        )
+            # CPU-bound work runs off the event loop
+            result = await run_inference(request, file_bytes, safe_filename)
 
-        # 6. ATOMIC UPSERT: Save new AI predictions to DB
-        stmt = insert(models.ImageScore).values(
-            filename=result["filename"],
-            serial_number=result["serial_number"],
-            sample_id=result["sample_id"],
-            score_architecture=result["scores"]["Pancreatic Architecture"],
-            score_atrophy=result["scores"]["Glandular Atrophy"],
-            score_complexes=result["scores"]["Pseudotubular Complexes"],
-            score_fibrosis=result["scores"]["Fibrosis"],
-            score_total=result["scores"]["Total"]
-        ).on_conflict_do_nothing(
-            index_elements=['filename']
-        )
+            # 6. ATOMIC UPSERT: Save new AI predictions to DB and get the id back
+            # in the same round trip. A no-op update (rather than DO NOTHING) makes
+            # RETURNING yield the id even if a concurrent upload inserted it first.
+            stmt = insert(models.ImageScore).values(
+                **crud.score_row(result)
+            ).on_conflict_do_update(
+                index_elements=['filename'],
+                set_={'updated_at': func.now()}
+            ).returning(models.ImageScore.id)
         
-        db.execute(stmt)
-        db.commit()
+            result["db_id"] = (await db.execute(stmt)).scalar_one()
+            await db.commit()
 
-        # 7. Retrieve the record (guaranteed to exist after upsert)
-        final_record = db.query(models.ImageScore).filter(
-            models.ImageScore.filename == result["filename"]
-        ).first()
-        
-        if not final_record:
-            # This should never happen with on_conflict_do_nothing, but safety check
-            raise HTTPException(500, "Failed to create database record")
-        
-        result["db_id"] = final_record.id
-        return result
+            await cache.set_score(redis, result)
+            return for_client(request, result)
 
     except HTTPException:
         # Re-raise HTTP exceptions as-is
         raise
     except Exception as e:
         logger.error(f"Upload failed for {safe_filename}: {e}", exc_info=True)
-        db.rollback()
+        await db.rollback()
         raise HTTPException(500, "Internal server error during image processing")
     finally:
         await file.close()
 
+@app.post("/api/upload-batch/")
+async def upload_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(database.get_db)
+) -> schemas.BatchResult:
+    """Scores a folder of TIFFs in one request and saves new rows in bulk."""
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(413, f"Too many files. Max: {MAX_BATCH_FILES} per batch")
+    filenames = [validate_upload(file) for file in files]
+    
+    if request.app.state.model is None:
+        raise HTTPException(503, "AI Model not loaded")
+
+    try:
+        stmt = select(models.ImageScore).where(models.ImageScore.filename.in_(filenames))
+        existing = {record.filename: record for record in (await db.execute(stmt)).scalars()}
+        file_bytes, budget = [], MAX_BATCH_SIZE
+        for file in files:
+            file_bytes.append(await read_upload(file, budget))
+            budget -= len(file_bytes[-1])
+
+        uploads = list(zip(file_bytes, filenames))
+
+        # New files are scored together; known ones only need their thumbnail
+        inferred, thumbnails = await asyncio.gather(
+            run_inference_batch(request, [(data, name) for data, name in uploads if name not in existing]),
+            asyncio.gather(*(stored_thumbnail(existing[name], data) for data, name in uploads if name in existing))
+        )
+        inferred, thumbnails = iter(inferred), iter(thumbnails)
+        results = [
+            cached_result(existing[name], next(thumbnails)) if name in existing else next(inferred)
+            for name in filenames
+        ]
+
+        # Same filename twice in one batch is only inserted once
+        new_rows = {
+            result["filename"]: crud.score_row(result)
+            for result in results if "db_id" not in result
+        }
+        await crud.bulk_save_scores(db, list(new_rows.values()))
+        await db.commit()  # Thumbnails backfilled onto older records
+
+        stmt = select(models.ImageScore.filename, models.ImageScore.id).where(
+            models.ImageScore.filename.in_(new_rows.keys())
+        )
+        ids = dict((await db.execute(stmt)).all())
+        for result in results:
+            result.setdefault("db_id", ids.get(result["filename"]))
+
+        return {
+            "status": "success",
+            "count": len(results),
+            "results": [for_client(request, result) for result in results]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch upload failed: {e}", exc_info=True)
+        await db.rollback()
+        raise HTTPException(500, "Internal server error during image processing")
+    finally:
+        for file in files:
+            await file.close()
+
 @app.put("/api/scores/{db_id}")
 async def update_score(
+    request: Request,
     db_id: int, 
     payload: dict = Body(...), 
-    db: Session = Depends(database.get_db)
-):
+    db: AsyncSession = Depends(database.get_db)
+) -> schemas.UpdateResult:
     """Update pathologist-corrected scores."""
-    record = db.query(models.ImageScore).filter(models.ImageScore.id == db_id).first()
-    if not record:
-        raise HTTPException(status_code=404, detail="Score record not found")
-    
-    # Update fields if present in payload
-    for field_name, db_column in SCORE_FIELDS.items():
-        if field_name in payload:
-            setattr(record, db_column, payload[field_name])
-    
-    # Recalculate Total - HANDLE NONE VALUES
-    record.score_total = (
-        (record.score_architecture or 0.0) + 
-        (record.score_atrophy or 0.0) + 
-        (record.score_complexes or 0.0) + 
-        (record.score_fibrosis or 0.0)
+    values = {column: payload[field] for field, column in SCORE_FIELDS.items() if field in payload}
+
+    # SET expressions read the old row, so the total takes the new value where one
+    # was sent and the stored column otherwise. Missing scores count as 0.
+    values["score_total"] = sum(
+        func.coalesce(values.get(column, getattr(models.ImageScore, column)), 0.0)
+        for column in SCORE_FIELDS.values()
     )
-    
-    db.commit()
-    db.refresh(record)
-    
-    return {"status": "updated", "new_total": record.score_total}
+
+    # One UPDATE ... RETURNING instead of SELECT + UPDATE + refresh
+    stmt = (
+        update(models.ImageScore)
+        .where(models.ImageScore.id == db_id)
+        .values(**values)
+        .returning(models.ImageScore.score_total, models.ImageScore.filename)
+    )
+    row = (await db.execute(stmt)).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Score record not found")
+
+    await db.commit()
+    await cache.delete_score(getattr(request.app.state, 'redis', None), row.filename)
+
+    return {"status": "updated", "new_total": row.score_total}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Exported so every worker's CPU_THREADS sees it. Capped at 4 by default: each
+    # worker loads its own model and opens its own Postgres pool, so the database sees
+    # up to WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) = 4 * (5 + 5) = 40
+    # connections, and the per-filename upload_lock only serializes within one worker.
+    # Set WEB_CONCURRENCY explicitly to go higher.
+    workers = int(os.environ.setdefault("WEB_CONCURRENCY", str(min(os.cpu_count() or 1, 4))))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        backlog=2048,
+        timeout_keep_alive=75,
+        # Behind a reverse proxy, base_url (see for_client) must reflect the public scheme (https)
+        proxy_headers=True,
+        forwarded_allow_ips="*"
+    )
\ No newline at end of file
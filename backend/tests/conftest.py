@@ -1,30 +1,45 @@
 # backend/tests/conftest.py
 
+from io import BytesIO
+
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from PIL import Image
 import torch
 import torch.nn as nn
 
 from main import app
 from app.database import Base, get_db
 from app.utils import get_model
+from app.batching import Batcher
 
 # --- DATABASE FIXTURE ---
 @pytest.fixture(scope="function")
-def test_db():
+def test_db_path(tmp_path):
+    """
+    Path of a fresh SQLite database file for each test.
+    A file (not :memory:) so the sync test session and the app's
+    async session see the same data.
+    """
+    return tmp_path / "test.db"
+
+
+@pytest.fixture(scope="function")
+def test_db(test_db_path):
     """
-    Creates a fresh in-memory SQLite database for each test.
+    Creates a fresh SQLite database for each test.
     This ensures tests don't interfere with each other.
     """
-    SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+    SQLALCHEMY_DATABASE_URL = f"sqlite:///{test_db_path}"
     
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
     )
     
     Base.metadata.create_all(bind=engine)
@@ -37,26 +52,65 @@ def test_db():
     finally:
         db.close()
         Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def async_session_factory(test_db, test_db_path):
+    """
+    Async sessions on the same database file as test_db.
+    NullPool: every session opens its own aiosqlite connection, so nothing
+    is shared across the event loops of different TestClients.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{test_db_path}", poolclass=NullPool)
+    return async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def async_db(async_session_factory):
+    """An AsyncSession for testing async helpers directly."""
+    async with async_session_factory() as session:
+        yield session
 
 
 # --- API CLIENT FIXTURE ---
+@pytest.fixture(scope="session")
+def app_client():
+    """
+    One TestClient for the whole session, so the lifespan (table creation,
+    model load and warmup) runs once instead of once per test.
+    """
+    with TestClient(app) as test_client:
+        yield test_client
+
+
 @pytest.fixture(scope="function")
-def client(test_db):
+def client(app_client, async_session_factory):
     """
-    Creates a TestClient with dependency override for the database.
+    The shared TestClient with the database dependency pointed at this test's database.
     """
-    def override_get_db():
-        try:
-            yield test_db
-        finally:
-            pass
+    async def override_get_db():
+        async with async_session_factory() as session:
+            yield session
     
     app.dependency_overrides[get_db] = override_get_db
     
-    with TestClient(app) as test_client:
-        yield test_client
+    yield app_client
     
-    app.dependency_overrides.clear()
+    app.dependency_overrides.pop(get_db, None)
+
+
+# --- TEST IMAGE FIXTURE ---
+@pytest.fixture(scope="session")
+def tiff_bytes():
+    """
+    A 224x224 red TIFF, encoded once per session.
+    Tests wrap it in BytesIO(...) for each upload.
+    """
+    img = Image.new('RGB', (224, 224), color='red')
+    buffer = BytesIO()
+    img.save(buffer, format='TIFF')
+    return buffer.getvalue()
 
 
 # --- MOCK MODEL FIXTURE ---
@@ -75,10 +129,17 @@ def mock_model():
 def client_with_model(client, mock_model):
     """
     Injects the mock model into app.state for testing upload endpoints.
+    Wrapped in a Batcher like the lifespan does; it starts on first use.
     """
-    app.state.model = mock_model
+    original_model = getattr(app.state, 'model', None)
+    batcher = Batcher(mock_model)
+    app.state.model = batcher
+    
     yield client
-    app.state.model = None
+    
+    # The client's event loop outlives the test, so stop the batching task on it
+    client.portal.call(batcher.stop)
+    app.state.model = original_model
 
 
 # --- NEW: CLIENT WITHOUT MODEL FIXTURE ---
@@ -23,24 +23,34 @@ class TestRootEndpoint:
         data = response.json()
         assert data["status"] == "healthy"
         assert data["model_loaded"] is True
+    
+    def test_health_check_reuses_recent_db_ping(self, client_with_model, monkeypatch):
+        """A second probe within HEALTH_DB_TTL should not query the database again."""
+        import main
+        monkeypatch.setattr(main, "_db_ok_until", 0.0)
+        assert client_with_model.get("/health").status_code == 200
+        
+        class BrokenSession:
+            async def execute(self, *args):
+                raise AssertionError("database probed again")
+        
+        async def broken_db():
+            yield BrokenSession()
+        monkeypatch.setitem(main.app.dependency_overrides, main.database.get_db, broken_db)
+        
+        assert client_with_model.get("/health").status_code == 200
+        
+        # Once the TTL has passed the probe runs (and fails) again
+        monkeypatch.setattr(main, "_db_ok_until", 0.0)
+        assert client_with_model.get("/health").status_code == 503
 
 
 class TestUploadImage:
     """Tests for /api/upload-image/ endpoint."""
     
-    def create_test_tiff(self, filename="test.tif"):
-        """Helper to create a test TIFF file."""
-        img = Image.new('RGB', (224, 224), color='red')
-        buffer = BytesIO()
-        img.save(buffer, format='TIFF')
-        buffer.seek(0)
-        buffer.name = filename  # Important: Add filename attribute
-        return buffer
-    
-    def test_upload_valid_tiff(self, client_with_model, test_db):
+    def test_upload_valid_tiff(self, client_with_model, test_db, tiff_bytes):
         """Should accept and process valid TIFF file."""
-        tiff_file = self.create_test_tiff("S-1234-10X_Image001.tif")
-        files = {"file": (tiff_file.name, tiff_file, "image/tiff")}
+        files = {"file": ("S-1234-10X_Image001.tif", BytesIO(tiff_bytes), "image/tiff")}
         
         response = client_with_model.post("/api/upload-image/", files=files)
         
@@ -70,17 +80,17 @@ class TestUploadImage:
         assert response.status_code == 400
         assert "Only .tif files supported" in response.json()["detail"]
     
-    def test_upload_duplicate_file_returns_cached(self, client_with_model, test_db):
+    def test_upload_duplicate_file_returns_cached(self, client_with_model, test_db, tiff_bytes):
         """Re-uploading same file should return DB record without re-inference."""
         # First upload
-        tiff_file1 = self.create_test_tiff("duplicate.tif")
+        tiff_file1 = BytesIO(tiff_bytes)
         files1 = {"file": ("duplicate.tif", tiff_file1, "image/tiff")}
         response1 = client_with_model.post("/api/upload-image/", files=files1)
         assert response1.status_code == 200
         original_scores = response1.json()["scores"]
         
         # Second upload (should retrieve from DB)
-        tiff_file2 = self.create_test_tiff("duplicate.tif")
+        tiff_file2 = BytesIO(tiff_bytes)
         files2 = {"file": ("duplicate.tif", tiff_file2, "image/tiff")}
         response2 = client_with_model.post("/api/upload-image/", files=files2)
         assert response2.status_code == 200
@@ -93,15 +103,62 @@ class TestUploadImage:
         count = test_db.query(ImageScore).count()
         assert count == 1
     
-    def test_upload_without_model_fails(self, client_without_model):
+    def test_duplicate_upload_uses_stored_thumbnail(self, client_with_model, test_db, monkeypatch, tiff_bytes):
+        """A cache hit should return the saved thumbnail without decoding the TIFF."""
+        import main
+        tiff_file1 = BytesIO(tiff_bytes)
+        response1 = client_with_model.post(
+            "/api/upload-image/", files={"file": ("S-3602-10X_Image004.tif", tiff_file1, "image/tiff")}
+        )
+        assert test_db.query(ImageScore).one().thumbnail_url == response1.json()["display_url"]
+        
+        def fail(*args):
+            raise AssertionError("thumbnail should not be regenerated")
+        monkeypatch.setattr(main, "generate_thumbnail_and_metadata", fail)
+        
+        tiff_file2 = BytesIO(tiff_bytes)
+        response2 = client_with_model.post(
+            "/api/upload-image/", files={"file": ("S-3602-10X_Image004.tif", tiff_file2, "image/tiff")}
+        )
+        assert response2.status_code == 200
+        data = response2.json()
+        assert data["display_url"] == response1.json()["display_url"]
+        assert data["serial_number"] == "S-3602-04"
+        assert data["sample_id"] == "S-3602"
+    
+    def test_upload_without_model_fails(self, client_without_model, tiff_bytes):
         """Should return 503 if model not loaded."""
-        tiff_file = self.create_test_tiff("test.tif")
+        tiff_file = BytesIO(tiff_bytes)
         files = {"file": ("test.tif", tiff_file, "image/tiff")}
         
         response = client_without_model.post("/api/upload-image/", files=files)
         
         assert response.status_code == 503
         assert "Model not loaded" in response.json()["detail"]
+    
+    def test_upload_over_size_limit_rejected(self, client_with_model, test_db, monkeypatch, tiff_bytes):
+        """A file over MAX_FILE_SIZE should get 413 while streaming, and nothing is saved."""
+        import main
+        tiff_file = BytesIO(tiff_bytes)
+        monkeypatch.setattr(main, "MAX_FILE_SIZE", len(tiff_bytes) - 1)
+        
+        files = {"file": ("big.tif", tiff_file, "image/tiff")}
+        response = client_with_model.post("/api/upload-image/", files=files)
+        
+        assert response.status_code == 413
+        assert test_db.query(ImageScore).count() == 0
+    
+    def test_content_length_over_limit_rejected_early(self, client_with_model, monkeypatch, tiff_bytes):
+        """A Content-Length far over the limit should be rejected before the body is parsed."""
+        import main
+        monkeypatch.setattr(main, "MAX_FILE_SIZE", 1000)
+        
+        tiff_file = BytesIO(tiff_bytes)
+        files = {"file": ("big.tif", tiff_file, "image/tiff")}
+        response = client_with_model.post("/api/upload-image/", files=files)
+        
+        assert response.status_code == 413
+        assert "File too large" in response.json()["detail"]
 
 
 class TestUpdateScore:
@@ -172,4 +229,150 @@ class TestUpdateScore:
         response = client.put(f"/api/scores/{record.id}", json=payload)
         
         assert response.status_code == 200
-        assert response.json()["new_total"] == 11.0
\ No newline at end of file
+        assert response.json()["new_total"] == 11.0
+
+    def test_update_with_missing_scores(self, client, test_db):
+        """Missing scores should count as 0 in the recomputed total."""
+        record = ImageScore(
+            filename="partial.tif",
+            serial_number="S-9999-01",
+            sample_id="S-9999",
+            score_architecture=2.0,
+            score_total=2.0
+        )
+        test_db.add(record)
+        test_db.commit()
+        test_db.refresh(record)
+
+        response = client.put(f"/api/scores/{record.id}", json={"Fibrosis": 1.5})
+
+        assert response.status_code == 200
+        assert response.json()["new_total"] == 3.5
+
+class TestUploadBatch:
+    """Tests for /api/upload-batch/ endpoint."""
+    
+    def test_upload_batch_saves_all_files(self, client_with_model, test_db, tiff_bytes):
+        """Every new file should be scored and saved in one request."""
+        files = [
+            ("files", ("S-1-10X_Image001.tif", BytesIO(tiff_bytes), "image/tiff")),
+            ("files", ("S-1-10X_Image002.tif", BytesIO(tiff_bytes), "image/tiff")),
+        ]
+        
+        response = client_with_model.post("/api/upload-batch/", files=files)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 2
+        assert [r["serial_number"] for r in data["results"]] == ["S-1-01", "S-1-02"]
+        assert all(r["db_id"] is not None for r in data["results"])
+        assert test_db.query(ImageScore).count() == 2
+    
+    def test_upload_batch_scores_new_files_in_one_forward_pass(self, client_with_model, tiff_bytes):
+        """All new files in a batch should go through the model together."""
+        import main
+        batcher = main.app.state.model
+        model = batcher.model
+        batch_sizes = []
+        
+        def recording_model(batch):
+            batch_sizes.append(batch.shape[0])
+            return model(batch)
+        batcher.model = recording_model
+        
+        files = [("files", (f"S-2-10X_Image00{i}.tif", BytesIO(tiff_bytes), "image/tiff")) for i in range(3)]
+        response = client_with_model.post("/api/upload-batch/", files=files)
+        
+        assert response.status_code == 200
+        assert batch_sizes == [3]
+    
+    def test_upload_batch_reuses_existing_records(self, client_with_model, test_db, tiff_bytes):
+        """Files already in the database should come back from the DB, not be re-inserted."""
+        first = client_with_model.post(
+            "/api/upload-image/",
+            files={"file": ("known.tif", BytesIO(tiff_bytes), "image/tiff")}
+        )
+        assert first.status_code == 200
+        
+        files = [
+            ("files", ("known.tif", BytesIO(tiff_bytes), "image/tiff")),
+            ("files", ("new.tif", BytesIO(tiff_bytes), "image/tiff")),
+        ]
+        response = client_with_model.post("/api/upload-batch/", files=files)
+        
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["db_id"] == first.json()["db_id"]
+        assert results[0]["scores"] == first.json()["scores"]
+        assert test_db.query(ImageScore).count() == 2
+    
+    def test_upload_batch_rejects_non_tiff(self, client_with_model, tiff_bytes):
+        """A single non-TIFF file should reject the whole batch."""
+        files = [
+            ("files", ("ok.tif", BytesIO(tiff_bytes), "image/tiff")),
+            ("files", ("bad.jpg", BytesIO(b"not an image"), "image/jpeg")),
+        ]
+        
+        response = client_with_model.post("/api/upload-batch/", files=files)
+        
+        assert response.status_code == 400
+    
+    def test_upload_batch_rejects_too_many_files(self, client_with_model, test_db, monkeypatch, tiff_bytes):
+        """More than MAX_BATCH_FILES files should get 413 before anything is read."""
+        import main
+        monkeypatch.setattr(main, "MAX_BATCH_FILES", 1)
+        files = [("files", (f"S-3-10X_Image00{i}.tif", BytesIO(tiff_bytes), "image/tiff")) for i in range(2)]
+        
+        response = client_with_model.post("/api/upload-batch/", files=files)
+        
+        assert response.status_code == 413
+        assert "Too many files" in response.json()["detail"]
+        assert test_db.query(ImageScore).count() == 0
+    
+    def test_upload_batch_over_total_size_rejected(self, client_with_model, test_db, monkeypatch, tiff_bytes):
+        """Files that each fit but together pass MAX_BATCH_SIZE should get 413 while streaming."""
+        import main
+        monkeypatch.setattr(main, "MAX_BATCH_SIZE", 2 * len(tiff_bytes) - 1)
+        # Keep the Content-Length check out of the way to exercise the streaming one
+        monkeypatch.setattr(main, "MULTIPART_OVERHEAD", len(tiff_bytes))
+        files = [("files", (f"S-4-10X_Image00{i}.tif", BytesIO(tiff_bytes), "image/tiff")) for i in range(2)]
+        
+        response = client_with_model.post("/api/upload-batch/", files=files)
+        
+        assert response.status_code == 413
+        assert "Batch too large" in response.json()["detail"]
+        assert test_db.query(ImageScore).count() == 0
+    
+    def test_upload_batch_content_length_over_limit_rejected_early(self, client_with_model, monkeypatch, tiff_bytes):
+        """A batch whose Content-Length is far over the budget should be rejected before parsing."""
+        import main
+        monkeypatch.setattr(main, "MAX_BATCH_SIZE", 1000)
+        monkeypatch.setattr(main, "MAX_BATCH_FILES", 2)
+        files = [("files", (f"S-5-10X_Image00{i}.tif", BytesIO(tiff_bytes), "image/tiff")) for i in range(2)]
+        
+        response = client_with_model.post("/api/upload-batch/", files=files)
+        
+        assert response.status_code == 413
+        assert "Batch too large" in response.json()["detail"]
+
+
+class TestUploadLock:
+    """Tests for the per-filename upload lock."""
+    
+    @pytest.mark.asyncio
+    async def test_same_filename_is_serialized_and_cleaned_up(self):
+        """A second upload of the same file should wait, and the lock should be dropped after."""
+        import asyncio
+        import main
+        order = []
+        
+        async def upload(tag):
+            async with main.upload_lock("same.tif"):
+                order.append(f"{tag}-start")
+                await asyncio.sleep(0.01)
+                order.append(f"{tag}-end")
+        
+        await asyncio.gather(upload("a"), upload("b"))
+        
+        assert order == ["a-start", "a-end", "b-start", "b-end"]
+        assert "same.tif" not in main._upload_locks
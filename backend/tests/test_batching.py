@@ -0,0 +1,70 @@
+# backend/tests/test_batching.py
+
+import asyncio
+
+import pytest
+import torch
+import torch.nn as nn
+
+from app.batching import Batcher
+
+
+class CountingModel(nn.Module):
+    """Tiny model that records the batch size of every forward pass."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+
+    def forward(self, x):
+        self.batch_sizes.append(x.shape[0])
+        self.channels_last = x.is_contiguous(memory_format=torch.channels_last)
+        return x.flatten(1).sum(dim=1, keepdim=True)
+
+
+class TestBatcher:
+    """Tests for the dynamic request batcher."""
+
+    @pytest.mark.asyncio
+    async def test_output_matches_direct_call(self):
+        """A submitted sample should get the same output as running the model directly."""
+        model = CountingModel()
+        batcher = Batcher(model).start()
+        try:
+            x = torch.randn(2, 4, 4)
+            result = await batcher.submit(x)
+            assert torch.allclose(result, model(x.unsqueeze(0))[0])
+        finally:
+            await batcher.stop()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_are_coalesced(self):
+        """Concurrent submissions should share forward passes."""
+        model = CountingModel()
+        batcher = Batcher(model, max_batch_size=8, timeout=0.2).start()
+        try:
+            samples = [torch.full((1, 2, 2), float(i)) for i in range(8)]
+            results = await asyncio.gather(*(batcher.submit(s) for s in samples))
+        finally:
+            await batcher.stop()
+
+        # Each caller gets its own row back
+        for i, result in enumerate(results):
+            assert result.item() == pytest.approx(4.0 * i)
+        assert len(model.batch_sizes) < len(samples)
+        assert max(model.batch_sizes) <= 8
+        assert model.channels_last
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate_to_callers(self):
+        """A failing forward pass should raise in the awaiting request."""
+        class BrokenModel(nn.Module):
+            def forward(self, x):
+                raise ValueError("boom")
+
+        batcher = Batcher(BrokenModel()).start()
+        try:
+            with pytest.raises(ValueError, match="boom"):
+                await batcher.submit(torch.randn(3, 4, 4))
+        finally:
+            await batcher.stop()
@@ -0,0 +1,69 @@
+# backend/tests/test_cache.py
+
+import pytest
+
+from app import cache
+
+
+class FakeRedis:
+    """In-memory stand-in for redis.asyncio.Redis (get/set/delete only)."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+class BrokenRedis:
+    async def get(self, key):
+        raise ConnectionError("redis down")
+
+
+def make_result(filename="S-1-10X_Image001.tif"):
+    return {
+        "status": "success",
+        "filename": filename,
+        "serial_number": "S-1-01",
+        "sample_id": "S-1",
+        "scores": {"Fibrosis": 1.0, "Total": 1.0},
+        "display_url": "data:image/jpeg;base64,AAAA",
+        "db_id": 7
+    }
+
+
+class TestScoreCache:
+    """Tests for the optional Redis result cache."""
+
+    @pytest.mark.asyncio
+    async def test_roundtrip_keeps_result(self):
+        """Cached results should come back whole, thumbnail included."""
+        redis = FakeRedis()
+        await cache.set_score(redis, make_result())
+
+        cached = await cache.get_score(redis, "S-1-10X_Image001.tif")
+
+        assert cached["db_id"] == 7
+        assert cached["scores"]["Total"] == 1.0
+        assert cached["display_url"].startswith("data:image/jpeg")
+
+    @pytest.mark.asyncio
+    async def test_delete_invalidates(self):
+        """delete_score should turn the next lookup into a miss."""
+        redis = FakeRedis()
+        await cache.set_score(redis, make_result())
+        await cache.delete_score(redis, "S-1-10X_Image001.tif")
+
+        assert await cache.get_score(redis, "S-1-10X_Image001.tif") is None
+
+    @pytest.mark.asyncio
+    async def test_disabled_and_failing_redis_are_misses(self):
+        """No client or a Redis error should fall back to the database."""
+        assert await cache.get_score(None, "a.tif") is None
+        assert await cache.get_score(BrokenRedis(), "a.tif") is None
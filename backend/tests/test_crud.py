@@ -0,0 +1,47 @@
+# backend/tests/test_crud.py
+
+import pytest
+
+from app import crud
+from app.models import ImageScore
+
+
+def make_row(filename, total=4.0):
+    return {
+        "filename": filename,
+        "serial_number": "S-1-01",
+        "sample_id": "S-1",
+        "score_architecture": 1.0,
+        "score_atrophy": 1.0,
+        "score_complexes": 1.0,
+        "score_fibrosis": 1.0,
+        "score_total": total
+    }
+
+
+class TestBulkSaveScores:
+    """Tests for bulk insertion of score rows."""
+    
+    @pytest.mark.asyncio
+    async def test_saves_rows_across_chunks(self, async_db, test_db, monkeypatch):
+        """Rows should all be saved even when split into several chunks."""
+        monkeypatch.setattr(crud, "BULK_CHUNK_SIZE", 2)
+        rows = [make_row(f"img{i}.tif") for i in range(5)]
+        
+        await crud.bulk_save_scores(async_db, rows)
+        
+        assert test_db.query(ImageScore).count() == 5
+    
+    @pytest.mark.asyncio
+    async def test_skips_existing_filenames(self, async_db, test_db):
+        """Existing filenames should be left untouched, not raise."""
+        await crud.bulk_save_scores(async_db, [make_row("dup.tif", total=4.0)])
+        await crud.bulk_save_scores(async_db, [make_row("dup.tif", total=8.0), make_row("other.tif")])
+        
+        assert test_db.query(ImageScore).count() == 2
+        record = test_db.query(ImageScore).filter(ImageScore.filename == "dup.tif").one()
+        assert record.score_total == 4.0
+    
+    def test_chunked_splits_evenly(self):
+        """chunked() should keep order and size limits."""
+        assert list(crud.chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
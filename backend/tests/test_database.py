@@ -0,0 +1,36 @@
+# backend/tests/test_database.py
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import database
+
+
+class TestAsyncUrl:
+    """Tests for switching DATABASE_URL to the asyncio drivers."""
+    
+    def test_postgres_uses_asyncpg(self):
+        """Postgres URLs should use the asyncpg driver."""
+        url = database.to_async_url("postgresql://user:pw@host:5432/db")
+        assert url == "postgresql+asyncpg://user:pw@host:5432/db"
+    
+    def test_sqlite_uses_aiosqlite(self):
+        """SQLite URLs should use the aiosqlite driver."""
+        assert database.to_async_url("sqlite:///./sql_app.db") == "sqlite+aiosqlite:///./sql_app.db"
+    
+    def test_explicit_driver_is_kept(self):
+        """URLs that already name a driver are left alone."""
+        url = "postgresql+asyncpg://host/db"
+        assert database.to_async_url(url) == url
+
+
+class TestGetDb:
+    """Tests for the get_db dependency."""
+    
+    @pytest.mark.asyncio
+    async def test_yields_async_session(self):
+        """get_db should yield an AsyncSession and close it afterwards."""
+        generator = database.get_db()
+        session = await generator.__anext__()
+        assert isinstance(session, AsyncSession)
+        await generator.aclose()
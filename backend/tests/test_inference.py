@@ -0,0 +1,147 @@
+# backend/tests/test_inference.py
+
+import os
+
+import torch
+
+from app.utils import get_model
+from app.inference import optimize_for_cpu, fuse_conv_bn, load_model, export_onnx, OnnxModel
+
+
+class TestOptimizeForCpu:
+    """Tests for the TorchScript serving conversion."""
+
+    def test_matches_eager_output(self):
+        """Frozen graph should produce the same scores as the eager model."""
+        model = get_model().eval()
+        x = torch.randn(2, 3, 224, 224)
+
+        with torch.no_grad():
+            expected = model(x)
+            actual = optimize_for_cpu(model)(x)
+
+        assert actual.shape == (2, 4)
+        assert torch.allclose(actual, expected, atol=1e-4)
+
+
+class TestFuseConvBn:
+    """Tests for folding BatchNorm into the convolutions."""
+
+    def test_matches_unfused_output(self):
+        """Fused model should score like the original and contain no BatchNorm."""
+        model = get_model().eval()
+        # Non-trivial running stats, so the fold actually changes the weights
+        for module in model.modules():
+            if isinstance(module, torch.nn.BatchNorm2d):
+                module.running_mean.uniform_(-0.5, 0.5)
+                module.running_var.uniform_(0.5, 2.0)
+        x = torch.randn(2, 3, 224, 224)
+
+        with torch.no_grad():
+            expected = model(x)
+            fused = fuse_conv_bn(model)
+            actual = fused(x)
+
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in fused.modules())
+        assert torch.allclose(actual, expected, atol=1e-4)
+
+
+class TestLoadModel:
+    """Tests for choosing between the int8 and FP32 models."""
+
+    def test_prefers_int8_model_when_present(self, tmp_path):
+        """An existing int8 TorchScript file should be loaded as-is."""
+        int8_path = tmp_path / "model_int8.pt"
+        tiny = torch.nn.Sequential(
+            torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten(), torch.nn.Linear(3, 4)
+        ).eval()
+        scripted = torch.jit.trace(tiny, torch.randn(1, 3, 224, 224))
+        torch.jit.save(scripted, int8_path)
+
+        model = load_model(tmp_path / "missing.pth", int8_path)
+
+        assert isinstance(model, torch.jit.ScriptModule)
+        assert model(torch.randn(2, 3, 224, 224)).shape == (2, 4)
+
+    def test_ignores_int8_model_older_than_checkpoint(self, tmp_path):
+        """An int8 file left over from before a retrain should not be served."""
+        int8_path = tmp_path / "model_int8.pt"
+        tiny = torch.nn.Sequential(
+            torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten(), torch.nn.Linear(3, 4)
+        ).eval()
+        torch.jit.save(torch.jit.trace(tiny, torch.randn(1, 3, 224, 224)), int8_path)
+        model_path = tmp_path / "model.pth"
+        torch.save(get_model().state_dict(), model_path)
+        os.utime(int8_path, (0, 0))
+
+        model = load_model(model_path, int8_path)
+
+        # The frozen ResNet graph, not the tiny int8 stand-in
+        assert "conv" in str(model.graph)
+
+    def test_falls_back_to_fp32_weights(self, tmp_path):
+        """Without an int8 file the FP32 checkpoint should be used."""
+        model_path = tmp_path / "model.pth"
+        torch.save(get_model().state_dict(), model_path)
+
+        model = load_model(model_path, tmp_path / "missing_int8.pt")
+
+        assert model(torch.randn(1, 3, 224, 224)).shape == (1, 4)
+
+    def test_compile_backend_falls_back_to_torchscript(self, tmp_path, monkeypatch):
+        """If torch.compile fails the FP32 model should still be served via TorchScript."""
+        model_path = tmp_path / "model.pth"
+        torch.save(get_model().state_dict(), model_path)
+
+        def broken_compile(*args, **kwargs):
+            raise RuntimeError("no compiler")
+        monkeypatch.setattr(torch, "compile", broken_compile)
+
+        model = load_model(model_path, backend="compile")
+
+        assert isinstance(model, torch.jit.ScriptModule)
+        assert torch.get_float32_matmul_precision() == "highest"
+
+
+class TestOnnxModel:
+    """Tests for the ONNX Runtime serving path."""
+
+    def test_matches_eager_output(self, tmp_path):
+        """ONNX Runtime should reproduce the PyTorch scores for any batch size."""
+        model = get_model().eval()
+        onnx_path = tmp_path / "model.onnx"
+        export_onnx(model, onnx_path)
+
+        x = torch.randn(3, 3, 224, 224)
+        with torch.no_grad():
+            expected = model(x)
+
+        actual = OnnxModel(onnx_path)(x)
+
+        assert actual.shape == (3, 4)
+        assert torch.allclose(actual, expected, atol=1e-4)
+
+    def test_auto_backend_ignores_stale_export(self, tmp_path):
+        """An ONNX file older than the checkpoint should not be served in auto mode."""
+        model_path = tmp_path / "model.pth"
+        onnx_path = tmp_path / "model.onnx"
+        export_onnx(get_model(), onnx_path)
+        torch.save(get_model().state_dict(), model_path)
+        os.utime(onnx_path, (0, 0))
+
+        model = load_model(model_path, onnx_path=onnx_path)
+
+        assert not isinstance(model, OnnxModel)
+
+    def test_onnx_backend_exports_once(self, tmp_path):
+        """backend='onnx' should export the checkpoint on first load and reuse the file after."""
+        model_path = tmp_path / "model.pth"
+        onnx_path = tmp_path / "model.onnx"
+        torch.save(get_model().state_dict(), model_path)
+
+        model = load_model(model_path, onnx_path=onnx_path, backend="onnx")
+        assert isinstance(model, OnnxModel)
+        exported_at = onnx_path.stat().st_mtime_ns
+
+        load_model(model_path, onnx_path=onnx_path, backend="onnx")
+        assert onnx_path.stat().st_mtime_ns == exported_at
@@ -0,0 +1,32 @@
+# backend/tests/test_preprocess_data.py
+
+import sys
+from pathlib import Path
+
+import pytest
+import numpy as np
+from PIL import Image
+
+# preprocess_data.py lives at the repository root, next to train_model.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+preprocess_data = pytest.importorskip("preprocess_data")
+
+
+class TestResize:
+    """Tests for the training-set resize."""
+
+    def test_vips_resize_matches_pillow(self, tmp_path):
+        """libvips and the Pillow fallback should produce (nearly) the same training image."""
+        pytest.importorskip("pyvips")
+
+        # Fine texture, more than 3x down: a different resampling kernel shows up as a large error
+        pixels = np.random.default_rng(0).integers(0, 256, (1800, 2400, 3), dtype=np.uint8)
+        raw_path = tmp_path / "raw.tif"
+        Image.fromarray(pixels).save(raw_path)
+
+        actual = np.asarray(preprocess_data.resize_with_vips(raw_path), dtype=np.float32)
+        expected = np.asarray(preprocess_data.resize_with_pillow(raw_path), dtype=np.float32)
+
+        assert actual.shape == expected.shape == (512, 512, 3)
+        assert np.abs(actual - expected).mean() < 1.0
+        assert np.abs(actual - expected).max() < 20
@@ -6,10 +6,17 @@ import numpy as np
 from PIL import Image
 from io import BytesIO
 
+from app import utils
 from app.utils import (
     get_model,
     predict_scores,
+    predict_scores_batch,
+    prepare_image,
+    decode_image,
+    postprocess,
+    postprocess_batch,
     generate_thumbnail_and_metadata,
+    parse_filename,
     MAX_SCORES,
     MODEL_TRANSFORMS
 )
@@ -91,6 +98,95 @@ class TestPredictScores:
         )
         
         assert abs(scores["Total"] - expected_total) < 0.01
+    
+    def test_split_pipeline_matches_predict_scores(self, mock_model):
+        """prepare_image + model + postprocess should give the same scores as predict_scores."""
+        img = Image.new('RGB', (300, 300), color='purple')
+        buffer = BytesIO()
+        img.save(buffer, format='TIFF')
+        
+        input_tensor, info = prepare_image(buffer.getvalue(), "S-3602-10X_Image001.tif")
+        with torch.inference_mode():
+            output = mock_model(input_tensor.unsqueeze(0))
+        
+        assert input_tensor.shape == (3, 224, 224)
+        assert info["serial_number"] == "S-3602-01"
+        assert info["display_url"].startswith("data:image/")
+        assert postprocess(output[0]) == predict_scores(img, mock_model)
+    
+    def test_predict_scores_batch_matches_single(self, mock_model):
+        """Scoring images together should match scoring them one by one."""
+        images = [Image.new('RGB', (300, 300), color=color) for color in ('red', 'navy', 'white')]
+        
+        assert predict_scores_batch(images, mock_model) == [predict_scores(img, mock_model) for img in images]
+    
+    def test_postprocess_batch_matches_rows(self):
+        """Post-processing a batch should give the same dicts as each row on its own."""
+        outputs = torch.tensor([[0.1, 0.5, 0.9, 1.2], [-0.2, 0.33, 0.66, 0.05]])
+        
+        expected = [postprocess(row) for row in outputs]
+        
+        assert postprocess_batch(outputs) == expected
+        assert outputs[0].tolist() == pytest.approx([0.1, 0.5, 0.9, 1.2])  # Input left untouched
+        assert expected[1]["Pancreatic Architecture"] == 0.0  # Clamped
+        assert expected[0]["Fibrosis"] == 4.0
+
+
+class TestModelTransforms:
+    """Tests for the inference preprocessing pipeline."""
+    
+    def test_output_shape(self):
+        """Any input size should become a normalized 3x224x224 tensor."""
+        img = Image.new('RGB', (1000, 600), color='red')
+        
+        tensor = MODEL_TRANSFORMS(img)
+        
+        assert tensor.shape == (3, 224, 224)
+        assert tensor.dtype == torch.float32
+    
+    def test_matches_training_preprocessing(self):
+        """Skipping the 512x512 PIL resize should not change what the model sees."""
+        from torchvision import transforms as v1
+        
+        # Smooth non-square gradient so resampling differences stay small
+        x = np.linspace(0, 255, 800, dtype=np.float32)
+        pixels = np.stack([
+            np.add.outer(x[:600] * 0.5, x * 0.5),
+            np.tile(x, (600, 1)),
+            np.tile(x[:600, None], (1, 800))
+        ], axis=-1).astype(np.uint8)
+        img = Image.fromarray(pixels)
+        
+        # Training: preprocess_data.py resize to 512x512, then train_model.py transforms
+        training_transforms = v1.Compose([
+            v1.Resize(256),
+            v1.CenterCrop(224),
+            v1.ToTensor(),
+            v1.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+        expected = training_transforms(img.resize((512, 512)))
+        
+        actual = MODEL_TRANSFORMS(img)
+        
+        assert (actual - expected).abs().mean() < 0.01
+    
+    def test_vips_preprocess_matches_pillow(self):
+        """The libvips pipeline should feed the model (nearly) the same tensor as Pillow."""
+        pytest.importorskip("pyvips")
+        from app.utils import vips_decode, vips_preprocess
+        
+        # Fine texture, more than 4x down: a different resampling kernel shows up as a large error
+        pixels = np.random.default_rng(0).integers(0, 256, (1024, 1360, 3), dtype=np.uint8)
+        img = Image.fromarray(pixels)
+        buffer = BytesIO()
+        img.save(buffer, format='TIFF')
+        
+        actual = vips_preprocess(vips_decode(buffer.getvalue()))
+        expected = MODEL_TRANSFORMS(img)
+        
+        assert actual.shape == (3, 224, 224)
+        assert (actual - expected).abs().mean() < 0.01
+        assert (actual - expected).abs().max() < 0.05
 
 
 class TestGenerateThumbnailAndMetadata:
@@ -112,6 +208,17 @@ class TestGenerateThumbnailAndMetadata:
         assert result["sample_id"] == "S-3602"
         assert result["serial_number"] == "S-3602-01"
     
+    @pytest.mark.parametrize("filename, sample_id, serial_number", [
+        ("S-3602-10X_Image7.tif", "S-3602", "S-3602-07"),
+        ("s-1-20x_image123_ch01.tif", "s-1", "s-1-23"),
+        ("NoDash_Image05.tif", "UNKNOWN", "UNKNOWN-05"),
+        ("A-B-C-D.tif", "A-B", "A-B-00"),
+        ("", "UNKNOWN", "UNKNOWN-00"),
+    ])
+    def test_parse_filename_edge_cases(self, filename, sample_id, serial_number):
+        """The precompiled pattern should handle partial and missing parts."""
+        assert parse_filename(filename) == {"serial_number": serial_number, "sample_id": sample_id}
+    
     def test_parse_filename_with_large_image_number(self):
         """Should extract last 2 digits from image number."""
         img = Image.new('RGB', (100, 100), color='blue')
@@ -138,7 +245,7 @@ class TestGenerateThumbnailAndMetadata:
             "test.tif"
         )
         
-        assert result["display_url"].startswith("data:image/png;base64,")
+        assert result["display_url"].startswith("data:image/jpeg;base64,")
     
     def test_thumbnail_is_resized(self):
         """Thumbnail should be smaller than original."""
@@ -174,4 +281,57 @@ class TestGenerateThumbnailAndMetadata:
         
         # Should not crash, should use defaults
         assert result["sample_id"] == "UNKNOWN"
-        assert result["serial_number"].endswith("-00")
\ No newline at end of file
+        assert result["serial_number"].endswith("-00")
+    
+    def test_draft_decodes_jpeg_at_reduced_scale(self):
+        """A thumbnail-only decode of a large JPEG should skip straight to a smaller scale."""
+        img = Image.new('RGB', (2000, 2000), color='orange')
+        buffer = BytesIO()
+        img.save(buffer, format='JPEG')
+        
+        decoded = decode_image(buffer.getvalue(), (400, 400))
+        
+        assert decoded.mode == 'RGB'
+        assert 400 <= decoded.width < 2000
+        assert decode_image(buffer.getvalue()).size == (2000, 2000)
+    
+    def test_accepts_decoded_image(self):
+        """A grayscale TIFF decoded once should feed the thumbnail without re-reading bytes."""
+        img = Image.new('L', (600, 300), color=128)
+        buffer = BytesIO()
+        img.save(buffer, format='TIFF')
+        
+        decoded = decode_image(buffer.getvalue())
+        result = generate_thumbnail_and_metadata(decoded, "S-1-10X_Image002.tif")
+        
+        assert decoded.mode == 'RGB'
+        assert decoded.size == (400, 200)  # thumbnail() shrank it in place
+        assert result["serial_number"] == "S-1-02"
+
+
+class TestPublishThumbnail:
+    """Tests for inline vs. static thumbnail URLs."""
+    
+    def test_inline_data_url_by_default(self, monkeypatch):
+        """Without THUMBNAIL_DIR the thumbnail is embedded as a data URL."""
+        monkeypatch.setattr(utils, "THUMBNAIL_DIR", None)
+        
+        url = utils.publish_thumbnail(b"tiff", lambda: b"jpeg")
+        
+        assert url.startswith("data:image/")
+    
+    def test_static_file_written_once(self, monkeypatch, tmp_path):
+        """With THUMBNAIL_DIR the thumbnail is saved under its content hash and reused."""
+        monkeypatch.setattr(utils, "THUMBNAIL_DIR", tmp_path)
+        renders = []
+        def render():
+            renders.append(1)
+            return b"jpeg"
+        
+        first = utils.publish_thumbnail(b"tiff", render)
+        second = utils.publish_thumbnail(b"tiff", render)
+        
+        assert first == second
+        assert first.startswith(utils.THUMBNAIL_URL_PATH + "/")
+        assert (tmp_path / first.rsplit("/", 1)[1]).read_bytes() == b"jpeg"
+        assert len(renders) == 1
@@ -0,0 +1,51 @@
+# build_cache.py
+
+import torch
+import pandas as pd
+from PIL import Image
+from torchvision import transforms
+from tqdm import tqdm
+
+from train_model import LABEL_FILE, PROCESSED_IMAGE_DIR, CACHE_PATH
+
+# Same resize + crop as training, but stops before ToTensor/Normalize so the
+# pixels stay uint8 (4x smaller than float32). CachedHistologyDataset normalizes.
+crop_transforms = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.PILToTensor(),
+])
+
+def build_cache():
+    """Decodes every processed training image once into CACHE_PATH."""
+    if not LABEL_FILE.exists():
+        print(f"[ERROR] Label file not found at {LABEL_FILE}")
+        return
+
+    df = pd.read_csv(LABEL_FILE)
+    images, filenames = [], []
+
+    for idx in tqdm(range(len(df)), desc="Caching Images"):
+        img_name = df.iloc[idx, 0]
+        try:
+            image = Image.open(PROCESSED_IMAGE_DIR / img_name).convert('RGB')
+        except FileNotFoundError:
+            continue
+
+        # Pixels only: CachedHistologyDataset reads the scores from the label file
+        images.append(crop_transforms(image))
+        filenames.append(img_name)
+
+    if not images:
+        print("[ERROR] No images found. Run preprocess_data.py first.")
+        return
+
+    torch.save({
+        'x': torch.stack(images),    # (N, 3, 224, 224) uint8
+        'filenames': filenames,
+    }, CACHE_PATH)
+
+    print(f"Cached {len(images)} images to: {CACHE_PATH}")
+
+if __name__ == "__main__":
+    build_cache()
@@ -59,10 +59,14 @@ export function ImagePreviewSidebar({
           <div className="relative min-h-[300px] flex items-center justify-center">
             {result && result.display_url ? (
               <div className="relative w-full h-[300px]">
+                {/* display_url is an API-sized thumbnail (data URL or /static/thumbs/...);
+                    skip the Next optimizer and let the browser decode it off the main thread */}
                 <Image
                   src={result.display_url}
                   alt="Preview"
                   fill
+                  unoptimized
+                  decoding="async"
                   className="object-contain"
                 />
               </div>
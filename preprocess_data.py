@@ -1,11 +1,20 @@
 # preprocess_data.py
 
 import os
+from multiprocessing import Pool
+import numpy as np
 import pandas as pd
 from PIL import Image
 from pathlib import Path
 from tqdm import tqdm # Import for progress bar
 
+# One libvips thread per worker: the process pool already uses every core
+os.environ.setdefault("VIPS_CONCURRENCY", "1")
+try:
+    import pyvips
+except (ImportError, OSError):  # Optional: Pillow handles everything without libvips
+    pyvips = None
+
 # --- Configuration ---
 ROOT_DIR = Path(__file__).parent
 RAW_IMAGE_DIR = ROOT_DIR / "dataset" / "raw_images"
@@ -15,8 +24,88 @@ LABEL_FILE = ROOT_DIR / "dataset" / "labels.csv"
 # Standard size for AI models
 TARGET_SIZE = (512, 512) 
 
+def processed_name(filename):
+    """New filename for the processed output (e.g., S-3349...jpg)."""
+    return f"{Path(filename).stem}.jpg"
+
+
+def resize_with_vips(raw_path):
+    """
+    Streams the TIFF through libvips, so the full-resolution raster is never held
+    in memory. Same antialiased linear kernel as Pillow's BILINEAR resize below
+    (gap=0: no box-filter pre-shrink), so the training set doesn't depend on
+    whether libvips is installed.
+    """
+    img = pyvips.Image.new_from_file(str(raw_path), access="sequential")
+    # 8-bit, 3-band sRGB like Pillow's convert('RGB')
+    if img.interpretation != "srgb":
+        img = img.colourspace("srgb")
+    if img.format != "uchar":
+        img = img.cast("uchar")
+    if img.bands > 3:
+        img = img.extract_band(0, n=3)
+    img = img.resize(TARGET_SIZE[0] / img.width, vscale=TARGET_SIZE[1] / img.height, kernel="linear", gap=0)
+    return Image.frombytes("RGB", (img.width, img.height), img.write_to_memory())
+
+
+def resize_with_pillow(raw_path):
+    """Pillow fallback when libvips is missing or can't read the file."""
+    # Open the TIFF image (SLOW STEP)
+    img = Image.open(raw_path)
+    
+    # Convert to RGB and resize (CRUCIAL for CNN training)
+    img = img.convert('RGB')
+    return img.resize(TARGET_SIZE, Image.Resampling.BILINEAR)
+
+
+def save_processed(img, processed_path):
+    """
+    Save the lightweight JPEG (FAST STEP). Several times smaller than PNG
+    for histology images and faster to decode in the training DataLoader.
+    Both resize paths encode here, so they share the JPEG settings too.
+    """
+    img.save(processed_path, "JPEG", quality=90, optimize=False, progressive=False)
+
+
+def _process_one(filename):
+    """
+    Converts one labelled TIFF to a resized JPEG.
+    Returns the new filename, or None if the image is missing or unreadable.
+    Runs in a worker process, so it only uses the module-level configuration.
+    """
+    raw_path = RAW_IMAGE_DIR / filename
+    processed_filename = processed_name(filename)
+    processed_path = PROCESSED_IMAGE_DIR / processed_filename
+    
+    # --- ROBUST ERROR HANDLING FOR MISSING FILES ---
+    try:
+        # Check if the raw file exists
+        if not raw_path.exists():
+            # print(f"\n[WARNING] Missing file: {filename}. Skipping entry.")
+            return None
+
+        # Check if the processed file already exists (to save time)
+        if processed_path.exists():
+            # If file is already processed, skip PIL/resize step
+            pass 
+        elif pyvips is not None:
+            try:
+                save_processed(resize_with_vips(raw_path), processed_path)
+            except pyvips.Error:
+                save_processed(resize_with_pillow(raw_path), processed_path)
+        else:
+            save_processed(resize_with_pillow(raw_path), processed_path)
+            
+        # We save the *new* JPEG filename so the training script can find it easily
+        return processed_filename
+
+    except Exception as e:
+        print(f"\n[ERROR] Could not process {filename}. Error: {e}. Skipping.")
+        return None
+
+
 def preprocess_images():
-    """Reads TIFFs, converts/resizes to PNG, and verifies label availability."""
+    """Reads TIFFs, converts/resizes to JPEG, and verifies label availability."""
     
     # 1. Setup
     PROCESSED_IMAGE_DIR.mkdir(parents=True, exist_ok=True)
@@ -33,56 +122,41 @@ def preprocess_images():
     
     print(f"Loaded {len(labels_df)} entries with complete scores from CSV.")
     
-    processed_files = []
+    filenames = labels_df['filename'].astype(str).tolist()
+    # New filename per label row; None = not processed
+    new_names = np.full(len(filenames), None, dtype=object)
 
-    # 2. Iterate through labels and process matching files
+    # 2. Rows whose image was converted on an earlier run are resolved here,
+    # without a round trip through a worker process
+    already_done = set(os.listdir(PROCESSED_IMAGE_DIR))
+    raw_files = set(os.listdir(RAW_IMAGE_DIR)) if RAW_IMAGE_DIR.is_dir() else set()
+    pending = []
+    for i, filename in enumerate(filenames):
+        processed_filename = processed_name(filename)
+        if processed_filename in already_done and filename in raw_files:
+            new_names[i] = processed_filename
+        else:
+            pending.append(i)
+    print(f"{len(filenames) - len(pending)} images already processed, {len(pending)} to convert.")
+
+    # 3. Convert the rest in parallel, one worker per core.
+    # Every image is independent; imap keeps the CSV order stable between runs.
     # tqdm provides a neat progress bar in the terminal
-    for index, row in tqdm(labels_df.iterrows(), total=len(labels_df), desc="Processing Images"):
-        
-        filename = row['filename']
-        raw_path = RAW_IMAGE_DIR / filename
-        
-        # New filename for the processed output (e.g., S-3349...png)
-        processed_filename = f"{Path(filename).stem}.png"
-        processed_path = PROCESSED_IMAGE_DIR / processed_filename
-        
-        # --- ROBUST ERROR HANDLING FOR MISSING FILES ---
-        try:
-            # Check if the raw file exists
-            if not raw_path.exists():
-                # print(f"\n[WARNING] Missing file: {filename}. Skipping entry.")
-                continue
-
-            # Check if the processed file already exists (to save time)
-            if processed_path.exists():
-                # If file is already processed, skip PIL/resize step
-                pass 
-            else:
-                # Open the TIFF image (SLOW STEP)
-                img = Image.open(raw_path)
-                
-                # Convert to RGB and resize (CRUCIAL for CNN training)
-                img = img.convert('RGB')
-                img_resized = img.resize(TARGET_SIZE)
-                
-                # Save the lightweight PNG (FAST STEP)
-                img_resized.save(processed_path, "PNG")
-                
-            # Add this successfully processed file to the list
-            # We save the *new* PNG filename so the training script can find it easily
-            row['filename'] = processed_filename
-            processed_files.append(row.to_dict())
-
-        except Exception as e:
-            print(f"\n[ERROR] Could not process {filename}. Error: {e}. Skipping.")
-            continue
+    if pending:
+        with Pool(os.cpu_count()) as pool:
+            converted = pool.imap(_process_one, [filenames[i] for i in pending], chunksize=16)
+            for result, i in zip(tqdm(converted, total=len(pending), desc="Processing Images"), pending):
+                new_names[i] = result
+
+    ok = pd.notna(new_names)
             
-    # 3. Create a final, clean CSV containing only successfully processed files
-    if not processed_files:
+    # 4. Create a final, clean CSV containing only successfully processed files
+    if not ok.any():
         print("[ERROR] No images were processed successfully. Check your raw_images folder.")
         return
 
-    final_df = pd.DataFrame(processed_files)
+    # Keep the successful label rows as they are, with the new filenames
+    final_df = labels_df.iloc[ok].assign(filename=new_names[ok])
     final_labels_path = ROOT_DIR / "dataset" / "final_labels_for_training.csv"
     final_df.to_csv(final_labels_path, index=False)
     
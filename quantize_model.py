@@ -0,0 +1,119 @@
+# quantize_model.py
+
+import torch
+import torch.nn as nn
+from torchvision import transforms
+from torchvision.models.quantization import resnet18
+from torch.ao.quantization import get_default_qconfig, prepare, convert
+import pandas as pd
+import numpy as np
+from PIL import Image
+from pathlib import Path
+from tqdm import tqdm
+
+# --- 1. Configuration ---
+ROOT_DIR = Path(__file__).parent
+DATA_DIR = ROOT_DIR / "dataset"
+PROCESSED_IMAGE_DIR = DATA_DIR / "processed_images"
+LABEL_FILE = DATA_DIR / "final_labels_for_training.csv"
+MODEL_PATH = ROOT_DIR / "backend" / "pancreas_model.pth"
+INT8_MODEL_PATH = ROOT_DIR / "backend" / "pancreas_model_int8.pt"
+
+NUM_CLASSES = 4
+
+# "x86" picks FBGEMM or oneDNN per op and uses the VNNI int8 kernels where the
+# CPU has them; older PyTorch builds only have plain FBGEMM
+QUANT_ENGINE = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+NUM_CALIBRATION_IMAGES = 100  # Enough for stable activation ranges
+NUM_VALIDATION_IMAGES = 100   # Held-out images for the drift check
+
+# Same as training: outputs are 0-1 fractions of these
+MAX_SCORES = np.array([4.0, 3.0, 3.0, 4.0], dtype=np.float32)
+# Largest mean |total score| change vs FP32 we accept (two 0.25 rounding steps)
+MAX_TOTAL_DRIFT = 0.5
+
+# Same transforms as training
+data_transforms = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+])
+
+# --- 2. Model Definition ---
+def get_quantizable_model():
+    """ResNet18 with quant/dequant stubs, loaded with the trained FP32 weights."""
+    model = resnet18(weights=None, quantize=False)
+    num_ftrs = model.fc.in_features
+    model.fc = nn.Linear(num_ftrs, NUM_CLASSES)
+
+    model.load_state_dict(torch.load(MODEL_PATH, map_location=torch.device('cpu'), weights_only=False))
+    model.eval()
+    return model
+
+def load_image_set(start, count):
+    """Yields `count` preprocessed training images, starting at row `start` of the label file."""
+    df = pd.read_csv(LABEL_FILE)
+    for filename in df['filename'].iloc[start:start + count]:
+        img_path = PROCESSED_IMAGE_DIR / filename
+        if not img_path.exists():
+            continue
+        image = Image.open(img_path).convert('RGB')
+        yield data_transforms(image).unsqueeze(0)
+
+def total_scores(outputs):
+    """Raw [N, 4] model outputs -> total scores, post-processed like the API."""
+    scores = np.clip(outputs.numpy() * MAX_SCORES, 0, MAX_SCORES)
+    return (np.round(scores * 4) / 4).sum(axis=1)
+
+def measure_drift(model_fp32, model_int8):
+    """Mean and max |total score| difference between FP32 and int8 on held-out images."""
+    drifts = []
+    with torch.no_grad():
+        for sample in load_image_set(NUM_CALIBRATION_IMAGES, NUM_VALIDATION_IMAGES):
+            drift = np.abs(total_scores(model_fp32(sample)) - total_scores(model_int8(sample)))
+            drifts.extend(drift.tolist())
+    if not drifts:
+        return 0.0, 0.0
+    return float(np.mean(drifts)), float(np.max(drifts))
+
+# --- 3. Static Quantization ---
+def quantize_model():
+    print(f"--- Quantizing model to int8 ({QUANT_ENGINE}) ---")
+    torch.backends.quantized.engine = QUANT_ENGINE
+
+    model_fp32 = get_quantizable_model()
+    # Conv+BN+ReLU must be fused before observers are inserted
+    model_fp32.fuse_model(is_qat=False)
+    model_fp32.qconfig = get_default_qconfig(QUANT_ENGINE)
+
+    prepared = prepare(model_fp32)
+
+    # Calibration: run representative images through the observers
+    with torch.no_grad():
+        for sample in tqdm(load_image_set(0, NUM_CALIBRATION_IMAGES), total=NUM_CALIBRATION_IMAGES, desc="Calibrating"):
+            prepared(sample)
+
+    quantized = convert(prepared)
+
+    # Don't ship a model that scores noticeably differently from the FP32 one
+    mean_drift, max_drift = measure_drift(get_quantizable_model(), quantized)
+    print(f"Total score drift vs FP32: mean {mean_drift:.3f}, max {max_drift:.3f}")
+    if mean_drift > MAX_TOTAL_DRIFT:
+        print(f"Drift exceeds {MAX_TOTAL_DRIFT}. Int8 model NOT saved; the API will use FP32.")
+        # An int8 model from an earlier run would otherwise keep being served
+        if INT8_MODEL_PATH.exists():
+            INT8_MODEL_PATH.unlink()
+            print(f"Removed the previous int8 model at {INT8_MODEL_PATH}")
+        return
+
+    # Save as TorchScript so the API can load it without the quantizable model code
+    example = torch.randn(1, 3, 224, 224)
+    with torch.no_grad():
+        scripted = torch.jit.trace(quantized, example)
+    torch.jit.save(scripted, INT8_MODEL_PATH)
+
+    print(f"\nQuantization Complete. Int8 model saved to: {INT8_MODEL_PATH}")
+
+if __name__ == "__main__":
+    quantize_model()
@@ -1,5 +1,6 @@
 # train_model.py
 
+import os
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -18,6 +19,7 @@ DATA_DIR = ROOT_DIR / "dataset"
 PROCESSED_IMAGE_DIR = DATA_DIR / "processed_images"
 LABEL_FILE = DATA_DIR / "final_labels_for_training.csv"
 MODEL_SAVE_PATH = ROOT_DIR / "backend" / "pancreas_model.pth"
+CACHE_PATH = DATA_DIR / "cache.pt"  # Optional, produced by build_cache.py
 
 # Hyperparameters
 BATCH_SIZE = 8
@@ -25,10 +27,17 @@ NUM_EPOCHS = 20
 LEARNING_RATE = 0.001
 NUM_CLASSES = 4 # The 4 scores
 
+# DataLoader worker processes: decode + transforms run alongside the training step
+NUM_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
 # Max scores for normalization (Architecture, Atrophy, Complexes, Fibrosis)
 # We normalize targets to 0-1 range for better training stability
 MAX_SCORES = np.array([4.0, 3.0, 3.0, 4.0], dtype=np.float32)
 
+# ImageNet statistics used by the Normalize transform
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
 # --- 2. Custom Dataset Loader ---
 class HistologyDataset(Dataset):
     def __init__(self, df, img_dir, transform=None):
@@ -67,6 +76,45 @@ class HistologyDataset(Dataset):
             
         return image, labels
 
+class CachedHistologyDataset(Dataset):
+    """
+    Serves the pre-decoded crops written by build_cache.py, so no image is
+    decoded or resized during training. Pixels are cached as uint8 and
+    normalized on the fly, matching ToTensor + Normalize.
+    Scores come from `df`, like HistologyDataset, so the cache only holds pixels.
+    """
+    def __init__(self, cache, df):
+        index = {name: i for i, name in enumerate(cache['filenames'])}
+        missing = [name for name in df['filename'] if name not in index]
+        if missing:
+            raise ValueError(
+                f"{len(missing)} images (e.g. {missing[0]}) are not in the cache. "
+                f"Re-run build_cache.py"
+            )
+        self.indices = [index[name] for name in df['filename']]
+        self.images = cache['x']
+        scores = df.iloc[:, 1:NUM_CLASSES+1].values.astype('float32') / MAX_SCORES
+        self.labels = torch.from_numpy(scores)
+        self.mean = torch.tensor(IMAGENET_MEAN).view(3, 1, 1)
+        self.std = torch.tensor(IMAGENET_STD).view(3, 1, 1)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        image = (self.images[self.indices[idx]].float().div_(255.0) - self.mean) / self.std
+        return image, self.labels[idx]
+
+def cache_is_current():
+    """
+    True if CACHE_PATH exists and is newer than the label file and the processed
+    images folder, i.e. was not built before the dataset was regenerated.
+    """
+    if not CACHE_PATH.exists():
+        return False
+    cached_at = CACHE_PATH.stat().st_mtime
+    return all(path.stat().st_mtime <= cached_at for path in (LABEL_FILE, PROCESSED_IMAGE_DIR) if path.exists())
+
 # --- 3. Model Definition ---
 def get_model():
     # Load ResNet18 pre-trained on ImageNet
@@ -88,6 +136,16 @@ def get_model():
     
     return model
 
+def freeze_batchnorm(model):
+    """
+    Puts the BatchNorm layers of the frozen blocks (stem, layer1, layer2) in eval mode,
+    so small training batches don't overwrite their ImageNet running statistics.
+    Call after every model.train().
+    """
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d) and not module.weight.requires_grad:
+            module.eval()
+
 def collate_fn(batch):
     batch = [item for item in batch if item is not None]
     if not batch: return None, None
@@ -109,36 +167,64 @@ def train_model():
         transforms.Resize(256),
         transforms.CenterCrop(224),
         transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
     ])
 
-    train_dataset = HistologyDataset(train_df, PROCESSED_IMAGE_DIR, data_transforms)
-    val_dataset = HistologyDataset(val_df, PROCESSED_IMAGE_DIR, data_transforms)
+    if CACHE_PATH.exists() and not cache_is_current():
+        print(f"NOTE: {CACHE_PATH} is older than the dataset, ignoring it. Re-run build_cache.py")
+
+    if cache_is_current():
+        # Decoded once by build_cache.py; mmap shares the pages with the DataLoader workers
+        cache = torch.load(CACHE_PATH, mmap=True)
+        print(f"Using cached images from {CACHE_PATH}")
+        train_dataset = CachedHistologyDataset(cache, train_df)
+        val_dataset = CachedHistologyDataset(cache, val_df)
+    else:
+        train_dataset = HistologyDataset(train_df, PROCESSED_IMAGE_DIR, data_transforms)
+        val_dataset = HistologyDataset(val_df, PROCESSED_IMAGE_DIR, data_transforms)
 
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, collate_fn=collate_fn)
-    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, collate_fn=collate_fn)
+    # Workers stay alive between epochs and keep a few batches ready.
+    # Pinned (page-locked) batches let .to(device, non_blocking=True) overlap the copy with compute.
+    loader_kwargs = dict(
+        batch_size=BATCH_SIZE,
+        collate_fn=collate_fn,
+        num_workers=NUM_WORKERS,
+        pin_memory=device.type == 'cuda',
+        persistent_workers=True,
+        prefetch_factor=4,
+    )
+    train_loader = DataLoader(train_dataset, shuffle=True, **loader_kwargs)
+    val_loader = DataLoader(val_dataset, shuffle=False, **loader_kwargs)
 
     # Setup Model
     model = get_model().to(device)
     criterion = nn.MSELoss() # Mean Squared Error for Regression
     optimizer = optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), lr=LEARNING_RATE)
 
+    # Mixed precision on GPU: FP16 forward/backward on Tensor Cores, with loss
+    # scaling so small gradients don't underflow. Disabled (plain FP32) on CPU.
+    use_amp = device.type == 'cuda'
+    scaler = torch.amp.GradScaler('cuda', enabled=use_amp)
+
     # Loop
     best_loss = float('inf')
     
     for epoch in range(NUM_EPOCHS):
         model.train()
+        freeze_batchnorm(model)
         running_loss = 0.0
         
         for inputs, labels in tqdm(train_loader, desc=f"Epoch {epoch+1}/{NUM_EPOCHS}"):
             if inputs is None: continue
-            inputs, labels = inputs.to(device), labels.to(device)
+            inputs, labels = inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True)
 
             optimizer.zero_grad()
-            outputs = model(inputs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
+            with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+                outputs = model(inputs)
+                loss = criterion(outputs, labels)
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
             running_loss += loss.item() * inputs.size(0)
 
         epoch_loss = running_loss / len(train_dataset)
@@ -149,9 +235,10 @@ def train_model():
         with torch.no_grad():
             for inputs, labels in val_loader:
                 if inputs is None: continue
-                inputs, labels = inputs.to(device), labels.to(device)
-                outputs = model(inputs)
-                loss = criterion(outputs, labels)
+                inputs, labels = inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True)
+                with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+                    outputs = model(inputs)
+                    loss = criterion(outputs, labels)
                 val_loss += loss.item() * inputs.size(0)
                 
         val_loss = val_loss / len(val_dataset)